@@ -1,378 +1,635 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
-from flask_login import login_required, current_user
-from models import db, User, Course, Enrollment, Assignment, Submission, LectureMaterial
-from datetime import datetime
-import csv
-from io import StringIO
-
-admin_bp = Blueprint('admin', __name__)
-
-@admin_bp.route('/admin/dashboard')
-@login_required
-def dashboard():
-    if not current_user.is_authenticated or current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('auth.login'))
-    
-    try:
-        # Get comprehensive statistics
-        total_students = User.query.filter_by(role='student').count()
-        total_teachers = User.query.filter_by(role='teacher').count()
-        total_courses = Course.query.count()
-        total_assignments = Assignment.query.count()
-        total_submissions = Submission.query.count()
-        
-        # Recent users
-        recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-        
-        # Recent enrollments with proper data
-        recent_enrollments_data = []
-        enrollments = Enrollment.query.order_by(Enrollment.enrolled_at.desc()).limit(5).all()
-        
-        for enrollment in enrollments:
-            student = User.query.get(enrollment.user_id)
-            course = Course.query.get(enrollment.course_id)
-            recent_enrollments_data.append({
-                'enrollment': enrollment,
-                'student': student,
-                'course': course
-            })
-        
-        # Course statistics
-        courses_with_stats = []
-        for course in Course.query.all():
-            student_count = Enrollment.query.filter_by(course_id=course.id, status='active').count()
-            assignment_count = Assignment.query.filter_by(course_id=course.id).count()
-            courses_with_stats.append({
-                'course': course,
-                'student_count': student_count,
-                'assignment_count': assignment_count
-            })
-        
-        return render_template('admin/dashboard.html',
-                            total_students=total_students,
-                            total_teachers=total_teachers,
-                            total_courses=total_courses,
-                            total_assignments=total_assignments,
-                            total_submissions=total_submissions,
-                            recent_users=recent_users,
-                            recent_enrollments=recent_enrollments_data,
-                            courses_with_stats=courses_with_stats)
-    
-    except Exception as e:
-        flash(f'Error loading dashboard: {str(e)}', 'error')
-        return redirect(url_for('admin.dashboard'))
-
-# USER MANAGEMENT
-@admin_bp.route('/admin/users')
-@login_required
-def user_management():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('auth.login'))
-    
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
-
-@admin_bp.route('/admin/users/create', methods=['POST'])
-@login_required
-def create_user():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    username = request.form.get('username')
-    student_number = request.form.get('student_number')
-    name = request.form.get('name')
-    role = request.form.get('role')
-    password = request.form.get('password')
-    
-    if not name or not role:
-        flash('Name and role are required', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    # Check for duplicates
-    if username and User.query.filter_by(username=username).first():
-        flash('Username already exists', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    if student_number and User.query.filter_by(student_number=student_number).first():
-        flash('Student number already exists', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    user = User(
-        username=username if username else None,
-        student_number=student_number if student_number else None,
-        name=name,
-        role=role
-    )
-    user.set_password(password if password else 'password123')
-    
-    db.session.add(user)
-    db.session.commit()
-    
-    flash(f'User {name} created successfully!', 'success')
-    return redirect(url_for('admin.user_management'))
-
-# REMOVED THE DUPLICATE EDIT_USER ROUTE - KEEP ONLY ONE VERSION
-@admin_bp.route('/admin/users/<int:user_id>/edit', methods=['POST'])
-@login_required
-def edit_user(user_id):
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    user = User.query.get(user_id)
-    if not user:
-        flash('User not found', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    user.name = request.form.get('name')
-    user.role = request.form.get('role')
-    
-    # Only update if provided
-    new_username = request.form.get('username')
-    if new_username:
-        existing_user = User.query.filter_by(username=new_username).first()
-        if existing_user and existing_user.id != user.id:
-            flash('Username already exists', 'error')
-            return redirect(url_for('admin.user_management'))
-        user.username = new_username
-    
-    new_student_number = request.form.get('student_number')
-    if new_student_number:
-        existing_user = User.query.filter_by(student_number=new_student_number).first()
-        if existing_user and existing_user.id != user.id:
-            flash('Student number already exists', 'error')
-            return redirect(url_for('admin.user_management'))
-        user.student_number = new_student_number
-    
-    new_password = request.form.get('password')
-    if new_password:
-        user.set_password(new_password)
-    
-    db.session.commit()
-    flash(f'User {user.name} updated successfully!', 'success')
-    return redirect(url_for('admin.user_management'))
-
-@admin_bp.route('/admin/users/<int:user_id>/delete', methods=['POST'])
-@login_required
-def delete_user(user_id):
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    user = User.query.get(user_id)
-    if not user:
-        flash('User not found', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    if user.id == current_user.id:
-        flash('Cannot delete your own account', 'error')
-        return redirect(url_for('admin.user_management'))
-    
-    db.session.delete(user)
-    db.session.commit()
-    flash(f'User {user.name} deleted successfully!', 'success')
-    return redirect(url_for('admin.user_management'))
-
-# COURSE MANAGEMENT
-@admin_bp.route('/admin/courses')
-@login_required
-def course_management():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('auth.login'))
-    
-    courses = Course.query.all()
-    # Get enrollment counts for each course
-    courses_with_stats = []
-    for course in courses:
-        student_count = Enrollment.query.filter_by(course_id=course.id, status='active').count()
-        teacher_assignments = Assignment.query.filter_by(course_id=course.id).first()
-        has_teacher = teacher_assignments is not None
-        courses_with_stats.append({
-            'course': course,
-            'student_count': student_count,
-            'has_teacher': has_teacher
-        })
-    
-    return render_template('admin/courses.html', courses_with_stats=courses_with_stats)
-
-@admin_bp.route('/admin/courses/create', methods=['POST'])
-@login_required
-def create_course():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    name = request.form.get('name')
-    description = request.form.get('description')
-    
-    if not name:
-        flash('Course name is required', 'error')
-        return redirect(url_for('admin.course_management'))
-    
-    if Course.query.filter_by(name=name).first():
-        flash('Course with this name already exists', 'error')
-        return redirect(url_for('admin.course_management'))
-    
-    course = Course(
-        name=name,
-        description=description
-    )
-    
-    db.session.add(course)
-    db.session.commit()
-    
-    flash(f'Course "{name}" created successfully!', 'success')
-    return redirect(url_for('admin.course_management'))
-
-@admin_bp.route('/admin/courses/<int:course_id>/edit', methods=['POST'])
-@login_required
-def edit_course(course_id):
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    course = Course.query.get(course_id)
-    if not course:
-        flash('Course not found', 'error')
-        return redirect(url_for('admin.course_management'))
-    
-    course.name = request.form.get('name')
-    course.description = request.form.get('description')
-    
-    db.session.commit()
-    flash(f'Course "{course.name}" updated successfully!', 'success')
-    return redirect(url_for('admin.course_management'))
-
-@admin_bp.route('/admin/courses/<int:course_id>/delete', methods=['POST'])
-@login_required
-def delete_course(course_id):
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    course = Course.query.get(course_id)
-    if not course:
-        flash('Course not found', 'error')
-        return redirect(url_for('admin.course_management'))
-    
-    # Check if course has enrollments or assignments
-    has_enrollments = Enrollment.query.filter_by(course_id=course_id).first()
-    has_assignments = Assignment.query.filter_by(course_id=course_id).first()
-    
-    if has_enrollments or has_assignments:
-        flash('Cannot delete course with existing enrollments or assignments', 'error')
-        return redirect(url_for('admin.course_management'))
-    
-    db.session.delete(course)
-    db.session.commit()
-    flash(f'Course "{course.name}" deleted successfully!', 'success')
-    return redirect(url_for('admin.course_management'))
-
-# ENROLLMENT MANAGEMENT
-@admin_bp.route('/admin/enrollments')
-@login_required
-def enrollment_management():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('auth.login'))
-    
-    enrollments = Enrollment.query.all()
-    students = User.query.filter_by(role='student').all()
-    courses = Course.query.all()
-    
-    return render_template('admin/enrollments.html',
-                         enrollments=enrollments,
-                         students=students,
-                         courses=courses)
-
-@admin_bp.route('/admin/enrollments/enroll', methods=['POST'])
-@login_required
-def enroll_student():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    student_id = request.form.get('student_id')
-    course_id = request.form.get('course_id')
-    
-    student = User.query.get(student_id)
-    course = Course.query.get(course_id)
-    
-    if not student or student.role != 'student':
-        flash('Invalid student', 'error')
-        return redirect(url_for('admin.enrollment_management'))
-    
-    # Check if already enrolled
-    existing = Enrollment.query.filter_by(
-        user_id=student_id, 
-        course_id=course_id,
-        status='active'
-    ).first()
-    
-    if existing:
-        flash('Student already enrolled in this course', 'error')
-        return redirect(url_for('admin.enrollment_management'))
-    
-    enrollment = Enrollment(
-        user_id=student_id,
-        course_id=course_id,
-        enrolled_by=current_user.id
-    )
-    
-    db.session.add(enrollment)
-    db.session.commit()
-    
-    flash(f'Student enrolled in {course.name} successfully!', 'success')
-    return redirect(url_for('admin.enrollment_management'))
-
-@admin_bp.route('/admin/enrollments/<int:enrollment_id>/drop', methods=['POST'])
-@login_required
-def drop_enrollment(enrollment_id):
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    enrollment = Enrollment.query.get(enrollment_id)
-    if not enrollment:
-        flash('Enrollment not found', 'error')
-        return redirect(url_for('admin.enrollment_management'))
-    
-    db.session.delete(enrollment)
-    db.session.commit()
-    
-    flash('Student dropped from course successfully', 'success')
-    return redirect(url_for('admin.enrollment_management'))
-
-# SYSTEM ANALYTICS
-# TEACHER MANAGEMENT
-@admin_bp.route('/admin/create-teacher', methods=['POST'])
-@login_required
-def create_teacher():
-    if current_user.role != 'admin':
-        flash('Admin access required', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    username = request.form.get('username')
-    name = request.form.get('name')
-    password = request.form.get('password')
-    
-    if User.query.filter_by(username=username).first():
-        flash('Username already exists', 'error')
-        return redirect(url_for('admin.dashboard'))
-    
-    teacher = User(
-        username=username,
-        name=name,
-        role='teacher'
-    )
-    teacher.set_password(password)
-    
-    db.session.add(teacher)
-    db.session.commit()
-    
-    flash(f'Teacher {name} created successfully!', 'success')
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask_login import login_required, current_user
+from models import db, User, Course, Enrollment, Assignment, Submission, LectureMaterial, Blob
+import deletion
+from user_import import import_users
+from enrollments import BulkEnrollmentError, parse_bulk_request, resolve_pairs, bulk_enroll, bulk_drop
+from cache import get_cache, invalidate_on_commit
+from search import search_users, user_search_clause
+from refdata import all_courses
+from config import Config
+from datetime import datetime
+import csv
+from io import StringIO
+
+admin_bp = Blueprint('admin', __name__)
+
+ENROLLMENTS_PER_PAGE = 50
+USERS_PER_PAGE = 50
+USER_ROLES = ('student', 'teacher', 'admin')
+DASHBOARD_CACHE_KEY = 'admin:dashboard'
+
+# Any committed change to these tables makes the next dashboard view recompute
+invalidate_on_commit(DASHBOARD_CACHE_KEY, User, Course, Enrollment, Assignment, Submission)
+
+def dashboard_snapshot():
+    """Everything the admin dashboard shows, as plain values that can be cached.
+
+    Runs a fixed number of queries however many courses there are: users
+    counted per role, the other totals in one statement, per-course counts
+    from grouped subqueries and the recent enrollments joined to their
+    student and course.
+    """
+    role_counts = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role))
+    total_courses, total_assignments, total_submissions = db.session.query(
+        db.select(db.func.count(Course.id)).scalar_subquery(),
+        db.select(db.func.count(Assignment.id)).scalar_subquery(),
+        db.select(db.func.count(Submission.id)).scalar_subquery()
+    ).one()
+    
+    recent_users = [
+        {'name': name, 'username': username, 'student_number': student_number, 'created_at': created_at}
+        for name, username, student_number, created_at in db.session.query(
+            User.name, User.username, User.student_number, User.created_at
+        ).order_by(User.created_at.desc()).limit(5)
+    ]
+    
+    recent_enrollments = [
+        {'user_id': user_id, 'course_id': course_id, 'enrolled_at': enrolled_at,
+         'student_name': student_name, 'course_name': course_name}
+        for user_id, course_id, enrolled_at, student_name, course_name in db.session.query(
+            Enrollment.user_id, Enrollment.course_id, Enrollment.enrolled_at, User.name, Course.name
+        ).outerjoin(User, User.id == Enrollment.user_id)
+         .outerjoin(Course, Course.id == Enrollment.course_id)
+         .order_by(Enrollment.enrolled_at.desc()).limit(5)
+    ]
+    
+    students = db.session.query(Enrollment.course_id, db.func.count(Enrollment.id).label('n')).filter(
+        Enrollment.status == 'active'
+    ).group_by(Enrollment.course_id).subquery()
+    assignments = db.session.query(Assignment.course_id, db.func.count(Assignment.id).label('n')).group_by(
+        Assignment.course_id
+    ).subquery()
+    courses_with_stats = [
+        {'name': name, 'description': description,
+         'student_count': student_count, 'assignment_count': assignment_count}
+        for name, description, student_count, assignment_count in db.session.query(
+            Course.name, Course.description,
+            db.func.coalesce(students.c.n, 0), db.func.coalesce(assignments.c.n, 0)
+        ).outerjoin(students, students.c.course_id == Course.id)
+         .outerjoin(assignments, assignments.c.course_id == Course.id)
+         .order_by(Course.id)
+    ]
+    
+    return {
+        'total_students': role_counts.get('student', 0),
+        'total_teachers': role_counts.get('teacher', 0),
+        'total_courses': total_courses,
+        'total_assignments': total_assignments,
+        'total_submissions': total_submissions,
+        'recent_users': recent_users,
+        'recent_enrollments': recent_enrollments,
+        'courses_with_stats': courses_with_stats
+    }
+
+@admin_bp.route('/admin/dashboard')
+@login_required
+def dashboard():
+    if not current_user.is_authenticated or current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('auth.login'))
+    
+    try:
+        snapshot = get_cache().get_or_set(DASHBOARD_CACHE_KEY, dashboard_snapshot,
+                                          Config.DASHBOARD_CACHE_SECONDS)
+        return render_template('admin/dashboard.html', **snapshot)
+    
+    except Exception as e:
+        flash(f'Error loading dashboard: {str(e)}', 'error')
+        return redirect(url_for('admin.dashboard'))
+
+# USER MANAGEMENT
+@admin_bp.route('/admin/users')
+@login_required
+def user_management():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('auth.login'))
+    
+    search = request.args.get('q', '').strip()
+    role = request.args.get('role', '')
+    if role not in USER_ROLES:
+        role = ''
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    
+    query = User.query
+    if role:
+        query = query.filter(User.role == role)
+    if search:
+        query = query.filter(user_search_clause(search))
+    
+    # Keyset pagination, newest first: pages are found through the id index
+    # rather than by counting past an OFFSET
+    if before:
+        users = query.filter(User.id > before).order_by(User.id.asc()).limit(USERS_PER_PAGE + 1).all()
+        if len(users) <= USERS_PER_PAGE:
+            # Back at the start: show a full first page instead of a short one
+            before = None
+        else:
+            users = users[:USERS_PER_PAGE][::-1]
+            prev_cursor = users[0].id
+            next_cursor = users[-1].id
+    if not before:
+        if after:
+            query = query.filter(User.id < after)
+        users = query.order_by(User.id.desc()).limit(USERS_PER_PAGE + 1).all()
+        has_more = len(users) > USERS_PER_PAGE
+        users = users[:USERS_PER_PAGE]
+        prev_cursor = users[0].id if after and users else None
+        next_cursor = users[-1].id if has_more else None
+    
+    return render_template('admin/users.html', users=users, prev_cursor=prev_cursor, next_cursor=next_cursor,
+                           filters={'q': search, 'role': role})
+
+@admin_bp.route('/admin/users/lookup')
+@login_required
+def lookup_users():
+    """Typeahead for users by name, username or student number, optionally of one role"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    
+    search = request.args.get('q', '').strip()
+    role = request.args.get('role') or None
+    if not search:
+        return jsonify({'success': True, 'users': []})
+    
+    return jsonify({
+        'success': True,
+        'users': [{'id': id, 'name': name, 'username': username, 'student_number': number, 'role': user_role}
+                  for id, name, username, number, user_role in search_users(search, role=role)]
+    })
+
+@admin_bp.route('/admin/users/create', methods=['POST'])
+@login_required
+def create_user():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    username = request.form.get('username')
+    student_number = request.form.get('student_number')
+    name = request.form.get('name')
+    role = request.form.get('role')
+    password = request.form.get('password')
+    
+    if not name or not role:
+        flash('Name and role are required', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    # Check for duplicates
+    if username and User.query.filter_by(username=username).first():
+        flash('Username already exists', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    if student_number and User.query.filter_by(student_number=student_number).first():
+        flash('Student number already exists', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    user = User(
+        username=username if username else None,
+        student_number=student_number if student_number else None,
+        name=name,
+        role=role
+    )
+    user.set_password(password if password else 'password123')
+    
+    db.session.add(user)
+    db.session.commit()
+    
+    flash(f'User {name} created successfully!', 'success')
+    return redirect(url_for('admin.user_management'))
+
+@admin_bp.route('/admin/users/import', methods=['GET', 'POST'])
+@login_required
+def import_users_csv():
+    """Create many users at once from an uploaded CSV file"""
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    report = None
+    dry_run = False
+    if request.method == 'POST':
+        file = request.files.get('csv_file')
+        if not file or file.filename == '':
+            flash('No file selected', 'error')
+            return redirect(url_for('admin.import_users_csv'))
+        
+        dry_run = request.form.get('dry_run') == '1'
+        report = import_users(file.stream, dry_run=dry_run, max_rows=Config.IMPORT_WEB_MAX_ROWS)
+        
+        if dry_run:
+            flash(f"Checked {report['rows']} row(s): {report['created']} can be imported, {len(report['errors'])} error(s)", 'success')
+        elif report['created']:
+            flash(f"Imported {report['created']} of {report['rows']} user(s)", 'success')
+        else:
+            flash('No users were imported', 'error')
+    
+    return render_template('admin/import_users.html', report=report, dry_run=dry_run)
+
+# REMOVED THE DUPLICATE EDIT_USER ROUTE - KEEP ONLY ONE VERSION
+@admin_bp.route('/admin/users/<int:user_id>/edit', methods=['POST'])
+@login_required
+def edit_user(user_id):
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    user = User.query.get(user_id)
+    if not user:
+        flash('User not found', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    user.name = request.form.get('name')
+    user.role = request.form.get('role')
+    
+    # Only update if provided
+    new_username = request.form.get('username')
+    if new_username:
+        existing_user = User.query.filter_by(username=new_username).first()
+        if existing_user and existing_user.id != user.id:
+            flash('Username already exists', 'error')
+            return redirect(url_for('admin.user_management'))
+        user.username = new_username
+    
+    new_student_number = request.form.get('student_number')
+    if new_student_number:
+        existing_user = User.query.filter_by(student_number=new_student_number).first()
+        if existing_user and existing_user.id != user.id:
+            flash('Student number already exists', 'error')
+            return redirect(url_for('admin.user_management'))
+        user.student_number = new_student_number
+    
+    new_password = request.form.get('password')
+    if new_password:
+        user.set_password(new_password)
+    
+    db.session.commit()
+    flash(f'User {user.name} updated successfully!', 'success')
+    return redirect(url_for('admin.user_management'))
+
+@admin_bp.route('/admin/users/<int:user_id>/delete', methods=['POST'])
+@login_required
+def delete_user(user_id):
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    user = User.query.get(user_id)
+    if not user:
+        flash('User not found', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    if user.id == current_user.id:
+        flash('Cannot delete your own account', 'error')
+        return redirect(url_for('admin.user_management'))
+    
+    # Related rows go in batches of set-based deletes; when not archiving,
+    # the user's files are released once each batch commits
+    name = user.name
+    archive = request.form.get('archive') == '1'
+    counts = deletion.delete_user(user, archive=archive, archived_by=current_user.id)
+    
+    details = deletion.describe_counts(counts)
+    flash(f"User {name} {'archived' if archive else 'deleted'} successfully!" +
+          (f' Also removed {details}.' if details else ''), 'success')
+    return redirect(url_for('admin.user_management'))
+
+# COURSE MANAGEMENT
+COURSES_PER_PAGE = 50
+# ?sort= values and what they order the course list by (strings are column labels)
+COURSE_SORT_COLUMNS = {
+    'id': Course.id,
+    'name': Course.name,
+    'students': 'student_count',
+    'assignments': 'assignment_count',
+    'materials': 'material_count',
+    'storage': 'storage_bytes',
+    'teachers': 'teacher_count'
+}
+
+def course_stats_query():
+    """Every course with its statistics, computed by grouped subqueries in one statement.
+
+    Rows are (course, student_count, assignment_count, material_count,
+    storage_bytes, teacher_count). Storage is the size of the distinct
+    stored files behind the course's materials and assignment handouts;
+    teachers are the distinct teachers who posted either.
+    """
+    students = db.session.query(Enrollment.course_id, db.func.count(Enrollment.id).label('n')).filter(
+        Enrollment.status == 'active'
+    ).group_by(Enrollment.course_id).subquery()
+    assignments = db.session.query(Assignment.course_id, db.func.count(Assignment.id).label('n')).group_by(
+        Assignment.course_id
+    ).subquery()
+    materials = db.session.query(LectureMaterial.course_id, db.func.count(LectureMaterial.id).label('n')).group_by(
+        LectureMaterial.course_id
+    ).subquery()
+    
+    # Blob paths look like blobs/ab/<sha256>.pdf, so the hash starts at character 10
+    files = db.union(
+        db.select(LectureMaterial.course_id, LectureMaterial.file_path),
+        db.select(Assignment.course_id, Assignment.file_path)
+    ).subquery()
+    course_blobs = db.select(files.c.course_id, Blob.sha256, Blob.size).join(
+        Blob, db.func.substr(files.c.file_path, 10, 64) == Blob.sha256
+    ).where(files.c.file_path.like('blobs/%')).distinct().subquery()
+    storage = db.select(course_blobs.c.course_id, db.func.sum(course_blobs.c.size).label('n')).group_by(
+        course_blobs.c.course_id
+    ).subquery()
+    
+    posters = db.union(
+        db.select(Assignment.course_id, Assignment.teacher_id),
+        db.select(LectureMaterial.course_id, LectureMaterial.teacher_id)
+    ).subquery()
+    teachers = db.select(posters.c.course_id, db.func.count().label('n')).group_by(posters.c.course_id).subquery()
+    
+    return (
+        db.session.query(
+            Course,
+            db.func.coalesce(students.c.n, 0).label('student_count'),
+            db.func.coalesce(assignments.c.n, 0).label('assignment_count'),
+            db.func.coalesce(materials.c.n, 0).label('material_count'),
+            db.func.coalesce(storage.c.n, 0).label('storage_bytes'),
+            db.func.coalesce(teachers.c.n, 0).label('teacher_count')
+        )
+        .outerjoin(students, students.c.course_id == Course.id)
+        .outerjoin(assignments, assignments.c.course_id == Course.id)
+        .outerjoin(materials, materials.c.course_id == Course.id)
+        .outerjoin(storage, storage.c.course_id == Course.id)
+        .outerjoin(teachers, teachers.c.course_id == Course.id)
+    )
+
+@admin_bp.route('/admin/courses')
+@login_required
+def course_management():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('auth.login'))
+    
+    sort = request.args.get('sort', 'name')
+    if sort not in COURSE_SORT_COLUMNS:
+        sort = 'name'
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    page = request.args.get('page', 1, type=int)
+    
+    column = COURSE_SORT_COLUMNS[sort]
+    query = course_stats_query().order_by(db.desc(column) if order == 'desc' else db.asc(column), Course.id)
+    courses = query.paginate(page=page, per_page=COURSES_PER_PAGE, error_out=False)
+    
+    return render_template('admin/courses.html', courses=courses, sort=sort, order=order)
+
+@admin_bp.route('/admin/courses/create', methods=['POST'])
+@login_required
+def create_course():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    name = request.form.get('name')
+    description = request.form.get('description')
+    
+    if not name:
+        flash('Course name is required', 'error')
+        return redirect(url_for('admin.course_management'))
+    
+    if Course.query.filter_by(name=name).first():
+        flash('Course with this name already exists', 'error')
+        return redirect(url_for('admin.course_management'))
+    
+    course = Course(
+        name=name,
+        description=description
+    )
+    
+    db.session.add(course)
+    db.session.commit()
+    
+    flash(f'Course "{name}" created successfully!', 'success')
+    return redirect(url_for('admin.course_management'))
+
+@admin_bp.route('/admin/courses/<int:course_id>/edit', methods=['POST'])
+@login_required
+def edit_course(course_id):
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    course = Course.query.get(course_id)
+    if not course:
+        flash('Course not found', 'error')
+        return redirect(url_for('admin.course_management'))
+    
+    course.name = request.form.get('name')
+    course.description = request.form.get('description')
+    
+    db.session.commit()
+    flash(f'Course "{course.name}" updated successfully!', 'success')
+    return redirect(url_for('admin.course_management'))
+
+@admin_bp.route('/admin/courses/<int:course_id>/delete', methods=['POST'])
+@login_required
+def delete_course(course_id):
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    course = Course.query.get(course_id)
+    if not course:
+        flash('Course not found', 'error')
+        return redirect(url_for('admin.course_management'))
+    
+    name = course.name
+    archive = request.form.get('archive') == '1'
+    counts = deletion.delete_course(course, archive=archive, archived_by=current_user.id)
+    
+    details = deletion.describe_counts(counts)
+    flash(f"Course \"{name}\" {'archived' if archive else 'deleted'} successfully!" +
+          (f' Also removed {details}.' if details else ''), 'success')
+    return redirect(url_for('admin.course_management'))
+
+# ENROLLMENT MANAGEMENT
+@admin_bp.route('/admin/enrollments')
+@login_required
+def enrollment_management():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('auth.login'))
+    
+    course_id = request.args.get('course_id', type=int)
+    status = request.args.get('status', '')
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    
+    # One joined query for the page instead of every enrollment, student and course
+    query = db.session.query(
+        Enrollment, User.name, User.student_number, Course.name
+    ).join(User, User.id == Enrollment.user_id).join(Course, Course.id == Enrollment.course_id)
+    
+    if course_id:
+        query = query.filter(Enrollment.course_id == course_id)
+    if status:
+        query = query.filter(Enrollment.status == status)
+    if search:
+        query = query.filter(db.or_(
+            User.name.ilike(f'%{search}%'),
+            User.student_number.ilike(f'{search}%')
+        ))
+    
+    enrollments = query.order_by(Enrollment.id.desc()).paginate(
+        page=page, per_page=ENROLLMENTS_PER_PAGE, error_out=False
+    )
+    courses = all_courses()
+    
+    return render_template('admin/enrollments.html',
+                         enrollments=enrollments,
+                         courses=courses,
+                         filters={'course_id': course_id, 'status': status, 'q': search})
+
+@admin_bp.route('/admin/students/search')
+@login_required
+def search_students():
+    """Typeahead for the enroll form: students whose name or number matches"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    
+    search = request.args.get('q', '').strip()
+    if len(search) < 2:
+        return jsonify({'success': True, 'students': []})
+    
+    students = search_users(search, role='student')
+    
+    return jsonify({
+        'success': True,
+        'students': [{'id': id, 'name': name, 'student_number': number} for id, name, username, number, role in students]
+    })
+
+@admin_bp.route('/admin/enrollments/enroll', methods=['POST'])
+@login_required
+def enroll_student():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    student_id = request.form.get('student_id')
+    course_id = request.form.get('course_id')
+    
+    student = User.query.get(student_id)
+    course = Course.query.get(course_id)
+    
+    if not student or student.role != 'student':
+        flash('Invalid student', 'error')
+        return redirect(url_for('admin.enrollment_management'))
+    
+    # Check if already enrolled
+    existing = Enrollment.query.filter_by(
+        user_id=student_id, 
+        course_id=course_id,
+        status='active'
+    ).first()
+    
+    if existing:
+        flash('Student already enrolled in this course', 'error')
+        return redirect(url_for('admin.enrollment_management'))
+    
+    enrollment = Enrollment(
+        user_id=student_id,
+        course_id=course_id,
+        enrolled_by=current_user.id
+    )
+    
+    db.session.add(enrollment)
+    db.session.commit()
+    
+    flash(f'Student enrolled in {course.name} successfully!', 'success')
+    return redirect(url_for('admin.enrollment_management'))
+
+@admin_bp.route('/admin/enrollments/<int:enrollment_id>/drop', methods=['POST'])
+@login_required
+def drop_enrollment(enrollment_id):
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    enrollment = Enrollment.query.get(enrollment_id)
+    if not enrollment:
+        flash('Enrollment not found', 'error')
+        return redirect(url_for('admin.enrollment_management'))
+    
+    db.session.delete(enrollment)
+    db.session.commit()
+    
+    flash('Student dropped from course successfully', 'success')
+    return redirect(url_for('admin.enrollment_management'))
+
+@admin_bp.route('/admin/enrollments/bulk', methods=['POST'])
+@login_required
+def bulk_enrollments():
+    """Enroll or drop many students in many courses in one request (form, CSV or JSON)"""
+    if current_user.role != 'admin':
+        if request.is_json:
+            return jsonify({'success': False, 'error': 'Admin access required'}), 403
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
+    action = data.get('action', 'enroll')
+    
+    try:
+        if action not in ('enroll', 'drop'):
+            raise BulkEnrollmentError('Action must be enroll or drop')
+        student_ids, student_numbers, course_ids, csv_pairs = parse_bulk_request(request)
+        pairs, unknown = resolve_pairs(student_ids, student_numbers, course_ids, csv_pairs)
+    except BulkEnrollmentError as e:
+        if request.is_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), 'error')
+        return redirect(url_for('admin.enrollment_management'))
+    
+    if action == 'enroll':
+        result = bulk_enroll(pairs, enrolled_by=current_user.id)
+        message = (f"Enrolled {result['enrolled']}, reactivated {result['reactivated']}, "
+                   f"{result['already_enrolled']} already enrolled")
+    else:
+        result = {'dropped': bulk_drop(pairs)}
+        message = f"Dropped {result['dropped']} enrollment(s)"
+    
+    if unknown:
+        message += f". Not found: {', '.join(unknown[:20])}" + (' ...' if len(unknown) > 20 else '')
+    
+    if request.is_json:
+        return jsonify({'success': True, **result, 'not_found': unknown})
+    
+    flash(message, 'success' if pairs else 'error')
+    return redirect(url_for('admin.enrollment_management'))
+
+# SYSTEM ANALYTICS
+# TEACHER MANAGEMENT
+@admin_bp.route('/admin/create-teacher', methods=['POST'])
+@login_required
+def create_teacher():
+    if current_user.role != 'admin':
+        flash('Admin access required', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    username = request.form.get('username')
+    name = request.form.get('name')
+    password = request.form.get('password')
+    
+    if User.query.filter_by(username=username).first():
+        flash('Username already exists', 'error')
+        return redirect(url_for('admin.dashboard'))
+    
+    teacher = User(
+        username=username,
+        name=name,
+        role='teacher'
+    )
+    teacher.set_password(password)
+    
+    db.session.add(teacher)
+    db.session.commit()
+    
+    flash(f'Teacher {name} created successfully!', 'success')
     return redirect(url_for('admin.dashboard'))
\ No newline at end of file
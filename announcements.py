@@ -0,0 +1,123 @@
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+from models import db, Announcement, Enrollment
+from api import ApiError, encode_cursor, decode_cursor
+from cache import bump_on_commit, cached_fragment, content_version, course_announcements
+from config import Config
+
+# Feed cursors count microseconds from here
+_EPOCH = datetime(1970, 1, 1)
+
+COLUMNS = (Announcement.id, Announcement.title, Announcement.content, Announcement.course_id,
+           Announcement.teacher_id, Announcement.created_at)
+
+def post_announcement(course_id, teacher_id, title, content):
+    """Write an announcement once, to its course's timeline. Students see it
+    when they next read their feed; nothing is written per student."""
+    announcement = Announcement(title=title, content=content, course_id=course_id, teacher_id=teacher_id)
+    db.session.add(announcement)
+    bump_on_commit(course_announcements(course_id))
+    db.session.commit()
+    return announcement
+
+def delete_announcement(announcement):
+    db.session.delete(announcement)
+    bump_on_commit(course_announcements(announcement.course_id))
+    db.session.commit()
+
+def _key(announcement):
+    """Feed order: newest first, ties broken by id"""
+    return announcement['created_at'], announcement['id']
+
+def _newest(course_id, before=None, limit=None):
+    """One course's announcements older than the before key, newest first:
+    a range of ix_announcement_course_created"""
+    if course_id is None:
+        query = db.select(*COLUMNS).where(Announcement.course_id.is_(None))
+    else:
+        query = db.select(*COLUMNS).where(Announcement.course_id == course_id)
+    if before:
+        created_at, announcement_id = before
+        query = query.where(db.or_(
+            Announcement.created_at < created_at,
+            db.and_(Announcement.created_at == created_at, Announcement.id < announcement_id)
+        ))
+    return query.order_by(Announcement.created_at.desc(), Announcement.id.desc()).limit(limit)
+
+def course_timeline(course_id):
+    """A course's newest ANNOUNCEMENT_TIMELINE_SIZE announcements as dicts,
+    newest first, from the fragment cache. Treat them as read-only."""
+    def load():
+        query = _newest(course_id, limit=Config.ANNOUNCEMENT_TIMELINE_SIZE)
+        return [dict(row._mapping) for row in db.session.execute(query)]
+    return cached_fragment(course_announcements(course_id), load)
+
+def feed_course_ids(student_id):
+    """The courses whose announcements a student sees"""
+    return [course_id for (course_id,) in db.session.query(Enrollment.course_id).filter_by(
+        user_id=student_id, status='active'
+    ).order_by(Enrollment.course_id)]
+
+def feed_versions(course_ids):
+    """Version stamps of every timeline in a feed, for its ETag"""
+    return tuple(content_version(course_announcements(course_id)) for course_id in (None, *course_ids))
+
+def student_feed(course_ids, before=None, limit=None):
+    """A page of the announcements to everyone and to course_ids, newest
+    first, and the key of its last one if there are more (else None).
+
+    Each course's timeline is already sorted, so a page is a k-way merge
+    of the cached timelines. A page that reaches past the cached part of a
+    timeline is read with one query instead, which merges the courses'
+    index ranges the same way.
+    """
+    limit = limit or Config.ANNOUNCEMENTS_PER_PAGE
+    course_ids = [None, *course_ids]
+    page = _merge_timelines(course_ids, before, limit + 1)
+    if page is None:
+        page = _query_feed(course_ids, before, limit + 1)
+    if len(page) > limit:
+        return page[:limit], _key(page[limit - 1])
+    return page, None
+
+def _merge_timelines(course_ids, before, count):
+    """The first count announcements older than before from the cached
+    timelines, or None if older ones left out of the cache could belong"""
+    timelines = []
+    cache_ends = []
+    for course_id in course_ids:
+        timeline = course_timeline(course_id)
+        if len(timeline) >= Config.ANNOUNCEMENT_TIMELINE_SIZE:
+            # A full timeline may have older announcements than it holds
+            oldest = _key(timeline[-1])
+            if before and before <= oldest:
+                return None
+            cache_ends.append(oldest)
+        if before:
+            timeline = [announcement for announcement in timeline if _key(announcement) < before]
+        timelines.append(timeline)
+    page = list(islice(heapq.merge(*timelines, key=_key, reverse=True), count))
+    if cache_ends and (len(page) < count or _key(page[-1]) < max(cache_ends)):
+        return None
+    return page
+
+def _query_feed(course_ids, before, count):
+    """The first count announcements older than before, from the database"""
+    legs = [_newest(course_id, before, count).subquery() for course_id in course_ids]
+    feed = db.union_all(*(db.select(leg) for leg in legs)).subquery()
+    query = db.select(feed).order_by(feed.c.created_at.desc(), feed.c.id.desc()).limit(count)
+    return [dict(row._mapping) for row in db.session.execute(query)]
+
+def feed_cursor(key):
+    """An opaque ?before= value for a key returned by student_feed()"""
+    created_at, announcement_id = key
+    return encode_cursor([(created_at - _EPOCH) // timedelta(microseconds=1), announcement_id])
+
+def parse_feed_cursor(cursor):
+    """The key a feed_cursor() stands for, or None if it is not one"""
+    try:
+        micros, announcement_id = decode_cursor(cursor, 2)
+        return _EPOCH + timedelta(microseconds=micros), announcement_id
+    except (ApiError, OverflowError):
+        return None
@@ -0,0 +1,335 @@
+import base64
+import binascii
+import gzip
+import json
+from collections import namedtuple
+from datetime import datetime
+from flask import Blueprint, current_app, request
+from flask_login import current_user
+from models import db, Course, Enrollment, Assignment, Submission, LectureMaterial, Notification, ChangeLog
+from config import Config
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# A collection the API serves.
+#   fields: name -> column, the columns a client may ask for (all by default)
+#   filters: query parameter -> column it must equal
+#   scope(user): criterion limiting the rows to what the user may see
+#   joins: (model, on clause) needed by fields from other tables
+#   newest_first: page from the highest id down
+Resource = namedtuple('Resource', 'model fields filters scope joins newest_first')
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+# Row scopes
+
+def _enrolled_courses(user):
+    return db.select(Enrollment.course_id).where(Enrollment.user_id == user.id, Enrollment.status == 'active')
+
+def _own_assignments(user):
+    return db.select(Assignment.id).where(Assignment.teacher_id == user.id)
+
+def _taught_courses(user):
+    """Courses a teacher has posted assignments or materials in"""
+    return db.union(
+        db.select(Assignment.course_id).where(Assignment.teacher_id == user.id),
+        db.select(LectureMaterial.course_id).where(LectureMaterial.teacher_id == user.id)
+    )
+
+def _course_scope(user):
+    if user.role == 'student':
+        return Course.id.in_(_enrolled_courses(user))
+    return db.true()
+
+def _assignment_scope(user):
+    if user.role == 'student':
+        return Assignment.course_id.in_(_enrolled_courses(user))
+    if user.role == 'teacher':
+        return Assignment.teacher_id == user.id
+    return db.true()
+
+def _submission_scope(user):
+    if user.role == 'student':
+        return Submission.student_id == user.id
+    if user.role == 'teacher':
+        return Submission.assignment_id.in_(_own_assignments(user))
+    return db.true()
+
+def _material_scope(user):
+    if user.role == 'student':
+        return LectureMaterial.course_id.in_(_enrolled_courses(user)) & LectureMaterial.is_published.is_(True)
+    if user.role == 'teacher':
+        return LectureMaterial.teacher_id == user.id
+    return db.true()
+
+def _enrollment_scope(user):
+    if user.role == 'student':
+        return Enrollment.user_id == user.id
+    if user.role == 'teacher':
+        return Enrollment.course_id.in_(_taught_courses(user))
+    return db.true()
+
+def _grade_scope(user):
+    return _submission_scope(user) & Submission.marks.isnot(None)
+
+def _notification_scope(user):
+    return Notification.user_id == user.id
+
+RESOURCES = {
+    'courses': Resource(
+        Course,
+        {'id': Course.id, 'name': Course.name, 'description': Course.description},
+        {}, _course_scope, (), False
+    ),
+    'assignments': Resource(
+        Assignment,
+        {'id': Assignment.id, 'title': Assignment.title, 'description': Assignment.description,
+         'course_id': Assignment.course_id, 'teacher_id': Assignment.teacher_id, 'due_date': Assignment.due_date,
+         'max_marks': Assignment.max_marks, 'created_at': Assignment.created_at},
+        {'course_id': Assignment.course_id}, _assignment_scope, (), False
+    ),
+    'submissions': Resource(
+        Submission,
+        {'id': Submission.id, 'assignment_id': Submission.assignment_id, 'student_id': Submission.student_id,
+         'status': Submission.status, 'marks': Submission.marks, 'feedback': Submission.feedback,
+         'submitted_at': Submission.submitted_at},
+        {'assignment_id': Submission.assignment_id, 'student_id': Submission.student_id, 'status': Submission.status},
+        _submission_scope, (), False
+    ),
+    'materials': Resource(
+        LectureMaterial,
+        {'id': LectureMaterial.id, 'title': LectureMaterial.title, 'description': LectureMaterial.description,
+         'course_id': LectureMaterial.course_id, 'teacher_id': LectureMaterial.teacher_id,
+         'week_number': LectureMaterial.week_number, 'file_type': LectureMaterial.file_type,
+         'is_published': LectureMaterial.is_published, 'created_at': LectureMaterial.created_at},
+        {'course_id': LectureMaterial.course_id, 'week_number': LectureMaterial.week_number},
+        _material_scope, (), False
+    ),
+    'enrollments': Resource(
+        Enrollment,
+        {'id': Enrollment.id, 'user_id': Enrollment.user_id, 'course_id': Enrollment.course_id,
+         'status': Enrollment.status, 'enrolled_at': Enrollment.enrolled_at},
+        {'user_id': Enrollment.user_id, 'course_id': Enrollment.course_id, 'status': Enrollment.status},
+        _enrollment_scope, (), False
+    ),
+    # Graded submissions with what the mark is out of
+    'grades': Resource(
+        Submission,
+        {'id': Submission.id, 'assignment_id': Submission.assignment_id, 'course_id': Assignment.course_id,
+         'student_id': Submission.student_id, 'marks': Submission.marks, 'max_marks': Assignment.max_marks,
+         'feedback': Submission.feedback, 'submitted_at': Submission.submitted_at},
+        {'assignment_id': Submission.assignment_id, 'course_id': Assignment.course_id,
+         'student_id': Submission.student_id},
+        _grade_scope, ((Assignment, Assignment.id == Submission.assignment_id),), False
+    ),
+    'notifications': Resource(
+        Notification,
+        {'id': Notification.id, 'title': Notification.title, 'message': Notification.message,
+         'notification_type': Notification.notification_type, 'related_id': Notification.related_id,
+         'is_read': Notification.is_read, 'created_at': Notification.created_at},
+        {'is_read': Notification.is_read, 'notification_type': Notification.notification_type},
+        _notification_scope, (), True
+    )
+}
+
+# Cursors
+
+def encode_cursor(values):
+    """An opaque cursor for a list of JSON-serialisable values"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, length=1):
+    """The values of a cursor made by encode_cursor(), which must hold length integers"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != length or not all(isinstance(value, int) for value in values):
+        raise ApiError('Invalid cursor')
+    return values
+
+# Responses
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    raise TypeError(f'{type(value).__name__} is not JSON serialisable')
+
+def json_response(payload, status=200):
+    """Compact JSON, gzipped when it is large and the client accepts gzip"""
+    body = json.dumps(payload, separators=(',', ':'), default=_json_default).encode('utf-8')
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= Config.API_GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(body, compresslevel=Config.API_GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@api_bp.errorhandler(ApiError)
+def _api_error(error):
+    return json_response({'success': False, 'error': error.message}, error.status)
+
+@api_bp.before_request
+def _require_login():
+    if not current_user.is_authenticated:
+        return json_response({'success': False, 'error': 'Login required'}, 401)
+
+# Query parameters
+
+def _int_list(name, value):
+    try:
+        return [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ApiError(f'{name} must be a comma-separated list of ids')
+
+def _selected_fields(resource):
+    """The fields named by ?fields=a,b (all when absent); id is always included"""
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return list(resource.fields)
+    unknown = [name for name in names if name not in resource.fields]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(resource.fields)}")
+    return ['id'] + [name for name in dict.fromkeys(names) if name != 'id']
+
+def _filter_value(column, value):
+    python_type = column.type.python_type
+    if python_type is bool:
+        if value.lower() not in ('1', '0', 'true', 'false'):
+            raise ApiError(f'{column.key} must be true or false')
+        return value.lower() in ('1', 'true')
+    if python_type is int:
+        try:
+            return int(value)
+        except ValueError:
+            raise ApiError(f'{column.key} must be a number')
+    return value
+
+def _page_size():
+    try:
+        limit = int(request.args.get('limit', Config.API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    return max(1, min(limit, Config.API_MAX_PAGE_SIZE))
+
+# Views
+
+def _select(resource, names):
+    query = db.select(*(resource.fields[name].label(name) for name in names)).select_from(resource.model)
+    for model, on in resource.joins:
+        query = query.join(model, on)
+    return query.where(resource.scope(current_user))
+
+def _rows(query, names):
+    return [dict(zip(names, row)) for row in db.session.execute(query)]
+
+@api_bp.route('/<resource_name>')
+def list_resource(resource_name):
+    """A page of a collection, or the rows named by ?ids=1,2,3.
+
+    Pages are ordered by id and continue from ?cursor=<next_cursor of the
+    previous page>. ?fields= picks the columns, and any of the collection's
+    filters can be given as ?name=value.
+    """
+    resource = RESOURCES.get(resource_name)
+    if not resource:
+        raise ApiError(f'Unknown collection: {resource_name}', 404)
+    names = _selected_fields(resource)
+    query = _select(resource, names)
+    id_column = resource.model.id
+
+    for name, column in resource.filters.items():
+        if name in request.args:
+            query = query.where(column == _filter_value(column, request.args[name]))
+
+    if 'ids' in request.args:
+        ids = _int_list('ids', request.args['ids'])
+        if len(ids) > Config.API_MAX_BATCH_IDS:
+            raise ApiError(f'At most {Config.API_MAX_BATCH_IDS} ids per request')
+        rows = _rows(query.where(id_column.in_(ids)).order_by(id_column), names)
+        found = {row['id'] for row in rows}
+        return json_response({'data': rows, 'missing': [row_id for row_id in ids if row_id not in found]})
+
+    limit = _page_size()
+    if 'cursor' in request.args:
+        after = decode_cursor(request.args['cursor'])[0]
+        query = query.where(id_column < after if resource.newest_first else id_column > after)
+    query = query.order_by(id_column.desc() if resource.newest_first else id_column)
+
+    # One extra row tells whether there is another page
+    rows = _rows(query.limit(limit + 1), names)
+    next_cursor = encode_cursor([rows[limit - 1]['id']]) if len(rows) > limit else None
+    return json_response({'data': rows[:limit], 'next_cursor': next_cursor})
+
+@api_bp.route('/<resource_name>/<int:row_id>')
+def get_resource(resource_name, row_id):
+    """One row of a collection, if the user may see it"""
+    resource = RESOURCES.get(resource_name)
+    if not resource:
+        raise ApiError(f'Unknown collection: {resource_name}', 404)
+    names = _selected_fields(resource)
+    rows = _rows(_select(resource, names).where(resource.model.id == row_id), names)
+    if not rows:
+        raise ApiError('Not found', 404)
+    return json_response({'data': rows[0]})
+
+def _feed_scope(user):
+    """Change log rows that may concern the user; each row is checked
+    against its collection's scope before it is returned"""
+    if user.role == 'admin':
+        return db.true()
+    if user.role == 'student':
+        courses = _enrolled_courses(user)
+        course_kinds = ('assignments', 'materials')
+    else:
+        courses = _taught_courses(user)
+        course_kinds = ('assignments', 'materials', 'submissions', 'enrollments')
+    return (ChangeLog.user_id == user.id) | (ChangeLog.course_id.in_(courses) & ChangeLog.kind.in_(course_kinds))
+
+@api_bp.route('/sync')
+def sync():
+    """What changed for this user since ?cursor=.
+
+    Without a cursor only the current cursor is returned: take it, load
+    the collections, then keep calling with the cursor each response
+    hands back. Changed rows the user can see come back in full under
+    "upserted"; rows deleted or no longer visible are
+    listed under "deleted". When the user's enrollments change, reload
+    that course's assignments and materials. A 410 means the cursor is
+    older than the kept history and everything must be reloaded.
+    """
+    head = db.session.query(db.func.max(ChangeLog.id)).scalar() or 0
+    if 'cursor' not in request.args:
+        return json_response({'changes': {}, 'cursor': encode_cursor([head]), 'has_more': False})
+
+    after = decode_cursor(request.args['cursor'])[0]
+    oldest = db.session.query(db.func.min(ChangeLog.id)).scalar()
+    if after > head or (oldest is not None and after < oldest - 1):
+        raise ApiError('Cursor expired; reload everything', 410)
+
+    limit = Config.SYNC_PAGE_SIZE
+    entries = db.session.query(ChangeLog.id, ChangeLog.kind, ChangeLog.row_id).filter(
+        ChangeLog.id > after, _feed_scope(current_user)
+    ).order_by(ChangeLog.id).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = {}
+    for entry_id, kind, row_id in entries:
+        changed.setdefault(kind, set()).add(row_id)
+    changes = {}
+    for kind, ids in changed.items():
+        resource = RESOURCES[kind]
+        names = list(resource.fields)
+        rows = _rows(_select(resource, names).where(resource.model.id.in_(ids)).order_by(resource.model.id), names)
+        visible = {row['id'] for row in rows}
+        changes[kind] = {'upserted': rows, 'deleted': sorted(ids - visible)}
+
+    # After the last page, skip past the changes that concern other users
+    cursor = entries[-1][0] if has_more else max(head, entries[-1][0] if entries else after)
+    return json_response({'changes': changes, 'cursor': encode_cursor([cursor]), 'has_more': has_more})
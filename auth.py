@@ -1,77 +1,77 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User
-from config import Config
-
-auth_bp = Blueprint('auth', __name__)
-@auth_bp.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        identifier = request.form.get('username')
-        password = request.form.get('password')
-        
-        # Find user by username or student_number
-        user = User.query.filter(
-            (User.username == identifier) | (User.student_number == identifier)
-        ).first()
-        
-        if user and user.check_password(password):
-            login_user(user)
-            flash('Login successful!', 'success')
-            
-            # Redirect based on role
-            if user.role == 'admin':
-                return redirect(url_for('admin.dashboard'))
-            elif user.role == 'teacher':
-                return redirect(url_for('teacher.dashboard'))
-            else:
-                return redirect(url_for('student.dashboard'))
-        else:
-            flash('Invalid credentials', 'error')
-    
-    return render_template('auth/login.html')
-
-@auth_bp.route('/register', methods=['GET', 'POST'])
-def register():
-    if request.method == 'POST':
-        student_number = request.form.get('student_number')
-        name = request.form.get('name')
-        password = request.form.get('password')
-        confirm_password = request.form.get('confirm_password')
-        
-        # Basic validation
-        if not student_number or not name or not password:
-            flash('All fields are required', 'error')
-            return render_template('auth/register.html')
-        
-        if password != confirm_password:
-            flash('Passwords do not match', 'error')
-            return render_template('auth/register.html')
-        
-        # Check if student number already exists
-        if User.query.filter_by(student_number=student_number).first():
-            flash('Student number already registered', 'error')
-            return render_template('auth/register.html')
-        
-        # Create student account
-        student = User(
-            student_number=student_number,
-            name=name,
-            role='student'
-        )
-        student.set_password(password)
-        
-        db.session.add(student)
-        db.session.commit()
-        
-        flash('Registration successful! Please login.', 'success')
-        return redirect(url_for('auth.login'))
-    
-    return render_template('auth/register.html')
-
-@auth_bp.route('/logout')
-@login_required
-def logout():
-    logout_user()
-    flash('You have been logged out', 'info')
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_user, logout_user, login_required, current_user
+from models import db, User
+from config import Config
+
+auth_bp = Blueprint('auth', __name__)
+@auth_bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        identifier = request.form.get('username')
+        password = request.form.get('password')
+        
+        # Find user by username or student_number
+        user = User.query.filter(
+            (User.username == identifier) | (User.student_number == identifier)
+        ).first()
+        
+        if user and user.check_password(password):
+            login_user(user)
+            flash('Login successful!', 'success')
+            
+            # Redirect based on role
+            if user.role == 'admin':
+                return redirect(url_for('admin.dashboard'))
+            elif user.role == 'teacher':
+                return redirect(url_for('teacher.dashboard'))
+            else:
+                return redirect(url_for('student.dashboard'))
+        else:
+            flash('Invalid credentials', 'error')
+    
+    return render_template('auth/login.html')
+
+@auth_bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        student_number = request.form.get('student_number')
+        name = request.form.get('name')
+        password = request.form.get('password')
+        confirm_password = request.form.get('confirm_password')
+        
+        # Basic validation
+        if not student_number or not name or not password:
+            flash('All fields are required', 'error')
+            return render_template('auth/register.html')
+        
+        if password != confirm_password:
+            flash('Passwords do not match', 'error')
+            return render_template('auth/register.html')
+        
+        # Check if student number already exists
+        if User.query.filter_by(student_number=student_number).first():
+            flash('Student number already registered', 'error')
+            return render_template('auth/register.html')
+        
+        # Create student account
+        student = User(
+            student_number=student_number,
+            name=name,
+            role='student'
+        )
+        student.set_password(password)
+        
+        db.session.add(student)
+        db.session.commit()
+        
+        flash('Registration successful! Please login.', 'success')
+        return redirect(url_for('auth.login'))
+    
+    return render_template('auth/register.html')
+
+@auth_bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    flash('You have been logged out', 'info')
     return redirect(url_for('auth.login'))
\ No newline at end of file
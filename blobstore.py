@@ -0,0 +1,257 @@
+import hashlib
+import os
+from collections import Counter
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session
+from models import db, Blob, Assignment, Submission, LectureMaterial
+from storage import get_storage, temp_key
+from config import Config
+
+BLOB_FOLDER = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+def blob_file_path(sha256, extension):
+    """The file_path stored on a row for a blob, e.g. blobs/ab/ab12...ef.pdf
+
+    The extension is kept so download names and file types still work,
+    but it is not part of the key: identical content is stored once.
+    """
+    path = f"{BLOB_FOLDER}/{sha256[:2]}/{sha256}"
+    return f"{path}.{extension}" if extension else path
+
+def is_blob_path(file_path):
+    return bool(file_path) and file_path.startswith(BLOB_FOLDER + '/')
+
+def blob_sha256(file_path):
+    """Content hash for a blob file_path, or None for legacy uploads"""
+    if not is_blob_path(file_path):
+        return None
+    return os.path.basename(file_path).split('.', 1)[0]
+
+def storage_key(file_path):
+    """Path of the stored bytes relative to the upload folder.
+
+    Legacy uploads (materials/<uuid>_name.pdf) resolve to themselves.
+    """
+    sha256 = blob_sha256(file_path)
+    if sha256:
+        return f"{BLOB_FOLDER}/{sha256[:2]}/{sha256}"
+    return file_path
+
+def upload_full_path(file_path):
+    """Path on local disk for a stored file_path value (local storage only)"""
+    return os.path.join(Config.UPLOAD_FOLDER, storage_key(file_path))
+
+def upload_exists(file_path):
+    return get_storage().exists(storage_key(file_path))
+
+class _HashingReader:
+    """Wraps a stream and hashes everything read through it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+def store_stream(stream, extension):
+    """Store a stream as a blob, hashing it while it is written.
+
+    The bytes go to a temporary key first, since the final key is only
+    known once the hash is. Returns the file_path for the row that
+    references it. The reference is added to the current session; the
+    caller commits it together with the row.
+    """
+    storage = get_storage()
+    reader = _HashingReader(stream)
+    tmp_key = temp_key()
+
+    try:
+        storage.put_stream(tmp_key, reader)
+        sha256 = reader.digest.hexdigest()
+        file_path = blob_file_path(sha256, extension)
+
+        # The reference is taken before looking for the bytes, so the
+        # reconciler cannot remove them between the check and the commit
+        add_reference(sha256, reader.size)
+        if storage.exists(storage_key(file_path)):
+            storage.delete(tmp_key)
+        else:
+            storage.move(tmp_key, storage_key(file_path))
+    except Exception:
+        storage.delete(tmp_key)
+        raise
+
+    return file_path
+
+def store_file(path, extension, sha256=None, size=None, keep_source=False):
+    """Move (or copy) a file on local disk into the blob store"""
+    if sha256 is None:
+        sha256, size = hash_file(path)
+
+    storage = get_storage()
+    file_path = blob_file_path(sha256, extension)
+    add_reference(sha256, size)
+    if not storage.exists(storage_key(file_path)):
+        storage.put_file(storage_key(file_path), path, move=not keep_source)
+
+    return file_path
+
+def hash_file(path):
+    """SHA-256 and size of a file, read in chunks"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def _upsert_blob(sha256, size, increment):
+    """Create a blob's row or add increment to its count, in one statement.
+
+    Either way the row stays locked (on SQLite, the database) until the
+    transaction ends, so concurrent uploads of the same content queue up
+    instead of both inserting.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f'Blob reference counting needs SQLite or PostgreSQL, not {dialect}')
+    statement = insert(Blob).values(sha256=sha256, size=size, ref_count=increment)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={'ref_count': Blob.__table__.c.ref_count + increment}
+    ))
+
+def add_reference(sha256, size):
+    """Count one more row pointing at a blob"""
+    _upsert_blob(sha256, size, 1)
+
+def remove_if_unused(sha256, size):
+    """Lock a blob's row and delete it if nothing references it.
+
+    Returns whether it was deleted. The caller removes the bytes before
+    committing, so an upload of the same content waits for the commit and
+    then finds them missing and stores them again.
+    """
+    _upsert_blob(sha256, size, 0)
+    return bool(Blob.query.filter(
+        Blob.sha256 == sha256,
+        Blob.ref_count <= 0
+    ).delete(synchronize_session=False))
+
+def release(file_path):
+    """Drop one reference to a stored file.
+
+    Blobs nothing references any more are left for `flask
+    reconcile-uploads --delete` to remove after its grace period; deleting
+    them here would race with an upload of the same content. Legacy
+    uploads were never shared, so they are removed once the surrounding
+    transaction commits.
+    """
+    if not file_path or '://' in file_path:
+        return
+
+    sha256 = blob_sha256(file_path)
+    if sha256:
+        Blob.query.filter_by(sha256=sha256).update(
+            {'ref_count': Blob.ref_count - 1},
+            synchronize_session=False
+        )
+        return
+
+    db.session.info.setdefault('released_files', []).append(storage_key(file_path))
+
+def release_all(file_paths):
+    """release() for many files at once: one executemany lowers every
+    reference count."""
+    counts = Counter()
+    for file_path in file_paths:
+        if not file_path or '://' in file_path:
+            continue
+        sha256 = blob_sha256(file_path)
+        if sha256:
+            counts[sha256] += 1
+        else:
+            db.session.info.setdefault('released_files', []).append(storage_key(file_path))
+    if not counts:
+        return
+
+    blobs = Blob.__table__
+    db.session.execute(
+        update(blobs).where(blobs.c.sha256 == bindparam('b_sha256')).values(ref_count=blobs.c.ref_count - bindparam('b_count')),
+        [{'b_sha256': sha256, 'b_count': count} for sha256, count in counts.items()]
+    )
+
+@event.listens_for(Session, 'after_commit')
+def _remove_released_files(session):
+    for key in session.info.pop('released_files', []):
+        get_storage().delete(key)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_released_files(session):
+    session.info.pop('released_files', None)
+
+def dedupe_uploads(dry_run=False, batch_size=200, log=print):
+    """Move legacy uploads into the blob store, storing each content once.
+
+    Rewrites file_path on assignments, submissions and materials in
+    batches. Legacy uploads are read from the local upload folder and
+    written to the configured storage backend, so this also migrates
+    them to S3. Originals are only removed after their batch has committed.
+    Returns the number of bytes freed.
+    """
+    bytes_freed = 0
+    seen = set(sha for (sha,) in db.session.query(Blob.sha256).all())
+
+    for model in (Assignment, Submission, LectureMaterial):
+        query = model.query.filter(
+            model.file_path.isnot(None),
+            ~model.file_path.like(BLOB_FOLDER + '/%'),
+            ~model.file_path.like('%://%')
+        ).order_by(model.id)
+
+        last_id = 0
+        while True:
+            rows = query.filter(model.id > last_id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            originals = []
+            for row in rows:
+                full_path = upload_full_path(row.file_path)
+                if not os.path.exists(full_path):
+                    log(f"  missing: {row.file_path} ({model.__tablename__} #{row.id})")
+                    continue
+
+                sha256, size = hash_file(full_path)
+                extension = row.file_path.rsplit('.', 1)[1].lower() if '.' in row.file_path else ''
+                if sha256 in seen:
+                    bytes_freed += size
+                seen.add(sha256)
+
+                if dry_run:
+                    continue
+                row.file_path = store_file(full_path, extension, sha256=sha256, size=size, keep_source=True)
+                originals.append(full_path)
+
+            if dry_run:
+                db.session.rollback()
+                continue
+
+            db.session.commit()
+            for full_path in originals:
+                os.remove(full_path)
+            log(f"  {model.__tablename__}: moved {len(originals)} file(s) up to id {last_id}")
+
+    return bytes_freed
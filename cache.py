@@ -0,0 +1,249 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import Config
+from models import db
+
+class BaseCache(ABC):
+    """get/set/delete interface shared by the cache backends"""
+
+    @abstractmethod
+    def get(self, key, default=None):
+        """The value stored under key, or default if missing or expired"""
+
+    @abstractmethod
+    def set(self, key, value, timeout=None):
+        """Store a value, expiring after timeout seconds if one is given"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Forget key, if it is stored"""
+
+    def get_or_set(self, key, create, timeout=None):
+        """The cached value, or create() stored for timeout seconds"""
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.set(key, value, timeout)
+        return value
+
+class MemoryCache(BaseCache):
+    """Entries in this process's memory; past max_entries the least
+    recently used go first"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires and expires < time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class FileCache(BaseCache):
+    """A small cache kept in a folder on local disk, so every worker process
+    on the host shares it. Each entry is one pickled file holding its expiry
+    time and value; entries are replaced atomically so readers never see a
+    half-written file."""
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, digest[:2], digest)
+
+    def get(self, key, default=None):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if expires and expires < time.time():
+            return default
+        return value
+
+    def set(self, key, value, timeout=None):
+        """Store a value for timeout seconds (None keeps it until deleted)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        expires = time.time() + timeout if timeout else 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Remove expired entries, including fragments of superseded
+        versions that nothing will read again. Returns (entries, bytes) removed."""
+        now = time.time()
+        removed = freed = 0
+        for root, dirs, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    size = os.path.getsize(path)
+                    with open(path, 'rb') as f:
+                        expires, value = pickle.load(f)
+                except (OSError, EOFError, pickle.UnpicklingError, TypeError, ValueError):
+                    continue
+                if not expires or expires >= now:
+                    continue
+                # A writer may have just replaced it; that only costs a cache miss
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += size
+        return removed, freed
+
+_cache = None
+_fragment_cache = None
+
+def get_cache():
+    """The shared cache, created on first use"""
+    global _cache
+    if _cache is None:
+        _cache = FileCache(Config.CACHE_FOLDER)
+    return _cache
+
+def get_fragment_cache():
+    """The configured backend for rendered page fragments, created on first use"""
+    global _fragment_cache
+    if _fragment_cache is None:
+        if Config.FRAGMENT_CACHE_BACKEND == 'memory':
+            _fragment_cache = MemoryCache(Config.FRAGMENT_CACHE_SIZE)
+        elif Config.FRAGMENT_CACHE_BACKEND == 'file':
+            _fragment_cache = get_cache()
+        else:
+            raise ValueError(f'Unknown FRAGMENT_CACHE_BACKEND: {Config.FRAGMENT_CACHE_BACKEND}')
+    return _fragment_cache
+
+# Versions: a shared stamp per piece of content. Dropping the stamp makes
+# the next reader pick a new one, so everything keyed by the old stamp is
+# simply never read again.
+
+def version_key(name):
+    return f'version:{name}'
+
+def content_version(name):
+    """The current version stamp of some content, shared by all workers"""
+    return get_cache().get_or_set(version_key(name), lambda: uuid.uuid4().hex)
+
+def bump_on_commit(*names):
+    """Give content a new version once the current transaction commits"""
+    db.session.info.setdefault('stale_cache_keys', set()).update(version_key(name) for name in names)
+
+def cached_fragment(name, render, depends_on=()):
+    """render() for some content, cached under its current version and the
+    versions of any other content it shows (depends_on names)"""
+    versions = ':'.join(content_version(version_name) for version_name in (name, *depends_on))
+    return get_fragment_cache().get_or_set(f'fragment:{name}:{versions}', render, Config.FRAGMENT_CACHE_SECONDS)
+
+# Content names
+
+def materials_fragment(course_id):
+    """A course's published material list, bumped when its materials change"""
+    return f'course:{course_id}:materials'
+
+def assignments_fragment(course_id):
+    """A course's assignment list, bumped when its assignments change"""
+    return f'course:{course_id}:assignments'
+
+def course_announcements(course_id):
+    """A course's announcement timeline (None: announcements to everyone),
+    bumped when one is posted or deleted"""
+    return 'announcements' if course_id is None else f'course:{course_id}:announcements'
+
+def user_notifications(user_id):
+    """A user's notifications, bumped when one is added or read"""
+    return f'user:{user_id}:notifications'
+
+def user_submissions(user_id):
+    """A student's submissions, bumped when one is made or graded"""
+    return f'user:{user_id}:submissions'
+
+# model class -> cache keys to drop when a commit changes rows of that model
+_dependents = {}
+# Called with the dropped keys, for copies this process holds in memory
+_invalidation_callbacks = []
+
+def invalidate_on_commit(key, *models):
+    """Delete a cache key whenever a committed transaction inserted, updated
+    or deleted rows of any of the given models."""
+    for model in models:
+        _dependents.setdefault(model, set()).add(key)
+
+def on_invalidate(callback):
+    """Register callback(keys), run after a commit drops cache keys"""
+    _invalidation_callbacks.append(callback)
+    return callback
+
+def _mark_stale(session, classes):
+    for cls in classes:
+        keys = _dependents.get(cls)
+        if keys:
+            session.info.setdefault('stale_cache_keys', set()).update(keys)
+
+@event.listens_for(Session, 'before_flush')
+def _track_flush(session, flush_context, instances):
+    _mark_stale(session, {type(obj) for obj in (*session.new, *session.dirty, *session.deleted)})
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statement(orm_execute_state):
+    # Bulk insert(), update() and delete() statements skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_stale(orm_execute_state.session, {mapper.class_ for mapper in orm_execute_state.all_mappers})
+
+@event.listens_for(Session, 'after_commit')
+def _drop_stale_keys(session):
+    keys = session.info.pop('stale_cache_keys', None)
+    if keys:
+        cache = get_cache()
+        for key in keys:
+            cache.delete(key)
+        for callback in _invalidation_callbacks:
+            callback(keys)
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_stale_keys(session):
+    session.info.pop('stale_cache_keys', None)
@@ -0,0 +1,88 @@
+from datetime import datetime
+from sqlalchemy import event, null, text
+from sqlalchemy.orm import Session
+from models import db, ChangeLog, Assignment, LectureMaterial, Submission, Enrollment, Notification
+
+# Models whose changes clients sync -> the API collection they belong to
+TRACKED = {
+    Assignment: 'assignments',
+    LectureMaterial: 'materials',
+    Submission: 'submissions',
+    Enrollment: 'enrollments',
+    Notification: 'notifications'
+}
+
+# Ids looked up per query by record_changes()
+CHUNK_SIZE = 1000
+
+# Taken for the rest of the transaction on PostgreSQL, so change rows
+# commit in id order (SQLite writers are serialized already)
+_LOCK_KEY = 4049
+
+def _keys(model):
+    """(course_id, user_id) columns that decide whose feed a change goes in"""
+    if model is Submission:
+        return Assignment.course_id, Submission.student_id
+    if model is Notification:
+        return null(), Notification.user_id
+    if model is Enrollment:
+        return Enrollment.course_id, Enrollment.user_id
+    return model.course_id, model.teacher_id
+
+def _entries(session, model, ids, action):
+    """ChangeLog rows for the given ids, looking up their course and user"""
+    if not ids:
+        return []
+    course_id, user_id = _keys(model)
+    query = db.select(model.id, course_id, user_id).where(model.id.in_(ids))
+    if model is Submission:
+        query = query.outerjoin(Assignment, Assignment.id == Submission.assignment_id)
+    now = datetime.utcnow()
+    return [{'kind': TRACKED[model], 'row_id': row_id, 'action': action, 'course_id': course, 'user_id': user,
+             'created_at': now}
+            for row_id, course, user in session.execute(query)]
+
+def _write(session, entries):
+    if not entries:
+        return
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': _LOCK_KEY})
+    session.execute(ChangeLog.__table__.insert(), entries)
+
+def record_changes(model, ids, action='upsert'):
+    """Log changes made by bulk statements, which the flush hooks below
+    never see. Call it after inserts and updates, but before deletes."""
+    ids = list(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        _write(db.session, _entries(db.session, model, ids[start:start + CHUNK_SIZE], action))
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changes(session, flush_context, instances):
+    pending = session.info.setdefault('pending_changes', {'upsert': set(), 'delete': []})
+    for obj in session.dirty:
+        if type(obj) in TRACKED and session.is_modified(obj):
+            pending['upsert'].add(obj)
+    for obj in session.new:
+        if type(obj) in TRACKED:
+            pending['upsert'].add(obj)
+    # Deleted rows are looked up while they still exist
+    deleted = {}
+    for obj in session.deleted:
+        if type(obj) in TRACKED:
+            deleted.setdefault(type(obj), []).append(obj.id)
+    for model, ids in deleted.items():
+        pending['delete'] += _entries(session, model, ids, 'delete')
+
+@event.listens_for(Session, 'after_flush')
+def _log_changes(session, flush_context):
+    pending = session.info.pop('pending_changes', None)
+    if not pending:
+        return
+    upserted = {}
+    for obj in pending['upsert']:
+        if obj not in session.deleted:
+            upserted.setdefault(type(obj), []).append(obj.id)
+    entries = list(pending['delete'])
+    for model, ids in upserted.items():
+        entries += _entries(session, model, ids, 'upsert')
+    _write(session, entries)
@@ -0,0 +1,171 @@
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from models import db, UploadSession
+from blobstore import store_stream, CHUNK_SIZE
+from storage import get_storage, temp_key
+from config import Config
+
+class ChunkedUploadError(Exception):
+    """Raised for a part or completion request that cannot be accepted"""
+
+def parts_prefix(upload_id):
+    return f"tmp/chunked/{upload_id}/"
+
+def part_key(upload_id, part_number):
+    return f"{parts_prefix(upload_id)}{part_number:06d}.part"
+
+def initiate_upload(teacher_id, course_id, filename, total_size, title,
+                    description=None, week_number=None):
+    """Start a chunked upload and return its session"""
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        teacher_id=teacher_id,
+        course_id=course_id,
+        filename=filename,
+        total_size=total_size,
+        title=title,
+        description=description,
+        week_number=week_number
+    )
+    db.session.add(session)
+    db.session.commit()
+    return session
+
+def received_parts(upload_id):
+    """Parts already stored as {part_number: size}, used to resume"""
+    parts = {}
+    for key, size, mtime in get_storage().iter_files(parts_prefix(upload_id)):
+        name = key.rsplit('/', 1)[-1]
+        if name.endswith('.part'):
+            parts[int(name[:-5])] = size
+    return parts
+
+class _LimitedHashingReader:
+    """Hashes a request stream and refuses to read past the part size"""
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(CHUNK_SIZE if size is None or size < 0 else size)
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise ChunkedUploadError('Part is larger than the part size')
+        self.digest.update(chunk)
+        return chunk
+
+def write_part(session, part_number, stream, expected_sha256=None):
+    """Stream one part to storage, hashing it on the way.
+
+    The part goes to a temporary key and only replaces the stored part
+    once its checksum has matched, so an interrupted or corrupt re-send
+    never costs a part that had arrived intact. Parts live on the storage
+    backend, so they may arrive at any app server.
+    """
+    if part_number < 1 or part_number > part_count(session):
+        raise ChunkedUploadError('Part number out of range')
+
+    storage = get_storage()
+    reader = _LimitedHashingReader(stream, Config.UPLOAD_PART_SIZE)
+    tmp_key = temp_key()
+
+    try:
+        storage.put_stream(tmp_key, reader)
+        sha256 = reader.digest.hexdigest()
+        if expected_sha256 and expected_sha256.lower() != sha256:
+            raise ChunkedUploadError('Part checksum does not match')
+        storage.move(tmp_key, part_key(session.id, part_number))
+    except Exception:
+        storage.delete(tmp_key)
+        raise
+
+    session.updated_at = datetime.utcnow()
+    db.session.commit()
+    return reader.size, sha256
+
+def part_count(session):
+    return max(1, -(-session.total_size // Config.UPLOAD_PART_SIZE))
+
+class _PartsReader:
+    """File-like reader over the parts of an upload, one part at a time"""
+
+    def __init__(self, keys):
+        self.keys = iter(keys)
+        self.current = None
+
+    def read(self, size=-1):
+        while True:
+            if self.current is None:
+                key = next(self.keys, None)
+                if key is None:
+                    return b''
+                self.current = get_storage().open(key)
+            chunk = self.current.read(CHUNK_SIZE if size is None or size < 0 else size)
+            if chunk:
+                return chunk
+            self.current.close()
+            self.current = None
+
+def complete_upload(session):
+    """Assemble the parts into the blob store and return the new file_path.
+
+    The parts are streamed through the blob store's hashing writer, so the
+    file is never held in memory. The session and its parts are removed;
+    the caller commits the blob reference together with the material row.
+    """
+    parts = received_parts(session.id)
+    expected = part_count(session)
+    missing = [n for n in range(1, expected + 1) if n not in parts]
+    if missing:
+        raise ChunkedUploadError(f'Missing parts: {", ".join(str(n) for n in missing[:10])}')
+    if sum(parts.values()) != session.total_size:
+        raise ChunkedUploadError('Uploaded size does not match the declared size')
+
+    extension = session.filename.rsplit('.', 1)[1].lower() if '.' in session.filename else ''
+    reader = _PartsReader(part_key(session.id, n) for n in range(1, expected + 1))
+    file_path = store_stream(reader, extension)
+
+    discard_upload(session, commit=False)
+    return file_path
+
+def discard_upload(session, commit=True):
+    """Remove an upload session and its parts"""
+    get_storage().delete_prefix(parts_prefix(session.id))
+    db.session.delete(session)
+    if commit:
+        db.session.commit()
+
+def collect_abandoned_uploads(max_age_hours=None):
+    """Delete uploads idle for longer than the TTL, plus part folders with no session.
+
+    Returns (sessions removed, bytes freed).
+    """
+    max_age_hours = max_age_hours or Config.UPLOAD_SESSION_TTL_HOURS
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+
+    removed = 0
+    bytes_freed = 0
+    for session in UploadSession.query.filter(UploadSession.updated_at < cutoff).all():
+        bytes_freed += sum(received_parts(session.id).values())
+        discard_upload(session)
+        removed += 1
+
+    # Parts left behind by a crash between deleting them and committing
+    stale = {}
+    for key, size, mtime in get_storage().iter_files('tmp/chunked/'):
+        upload_id = key.split('/')[2]
+        if upload_id not in stale:
+            stale[upload_id] = UploadSession.query.get(upload_id) is None
+        if stale[upload_id] and datetime.utcfromtimestamp(mtime) < cutoff:
+            bytes_freed += size
+        else:
+            stale[upload_id] = False
+    for upload_id, is_stale in stale.items():
+        if is_stale:
+            get_storage().delete_prefix(parts_prefix(upload_id))
+
+    return removed, bytes_freed
@@ -0,0 +1,206 @@
+import click
+
+def register_commands(app):
+    """Attach the app's `flask` CLI commands.
+
+    Each command imports what it needs when it runs, so registering them
+    costs the web workers nothing.
+    """
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create the tables and indexes, the default courses and the admin account."""
+        from app import setup_database
+        setup_database(log=click.echo)
+        click.echo('Database ready')
+
+    @app.cli.command('send-reminders')
+    @click.option('--loop', is_flag=True, help='Keep running and send reminders as they fall due.')
+    def send_reminders(loop):
+        """Send due-date reminders to students who have not submitted."""
+        from reminders import ReminderScheduler
+        scheduler = ReminderScheduler()
+        if loop:
+            click.echo('Reminder scheduler running (Ctrl+C to stop)')
+            scheduler.run()
+        else:
+            sent = scheduler.tick()
+            click.echo(f'Sent {sent} reminder(s)')
+
+    @app.cli.command('dedupe-uploads')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be freed.')
+    def dedupe_uploads_command(dry_run):
+        """Move existing uploads into the content-addressed blob store."""
+        from blobstore import dedupe_uploads
+        bytes_freed = dedupe_uploads(dry_run=dry_run, log=click.echo)
+        verb = 'Would free' if dry_run else 'Freed'
+        click.echo(f'{verb} {bytes_freed / (1024 * 1024):.1f} MB of duplicate uploads')
+
+    @app.cli.command('gc-uploads')
+    @click.option('--max-age-hours', type=float, help='Idle time before an upload counts as abandoned.')
+    def gc_uploads(max_age_hours):
+        """Delete abandoned chunked uploads."""
+        from chunked_uploads import collect_abandoned_uploads
+        removed, bytes_freed = collect_abandoned_uploads(max_age_hours)
+        click.echo(f'Removed {removed} abandoned upload(s), freed {bytes_freed / (1024 * 1024):.1f} MB')
+
+    @app.cli.command('reconcile-uploads')
+    @click.option('--delete', is_flag=True, help='Delete orphaned files instead of only reporting them.')
+    @click.option('--limit', type=int, help='Stop after this many files and save a checkpoint.')
+    @click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and start from the top.')
+    def reconcile_uploads_command(delete, limit, restart):
+        """Find orphaned upload files and rows pointing at missing files."""
+        from reconcile import reconcile_uploads
+        totals = reconcile_uploads(delete=delete, limit=limit, resume=not restart, log=click.echo)
+        click.echo(f"Checked {totals['files']} file(s): {totals['orphans']} orphaned "
+                   f"({totals['bytes_orphaned'] / (1024 * 1024):.1f} MB), {totals['dangling']} dangling reference(s)")
+        if delete:
+            click.echo(f"Reclaimed {totals['bytes_reclaimed'] / (1024 * 1024):.1f} MB")
+        if not totals['complete']:
+            click.echo('Stopped at the limit; run again to continue from the checkpoint')
+
+    @app.cli.command('build-previews')
+    def build_previews():
+        """Render missing preview images for PDF and image materials."""
+        from previews import build_missing_previews
+        built, failed = build_missing_previews(log=click.echo)
+        click.echo(f'Built {built} preview(s), {failed} failed')
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Re-index all materials and assignments, including their file text."""
+        from search import rebuild_search_index
+        count = rebuild_search_index(log=click.echo)
+        click.echo(f'Indexed {count} document(s)')
+
+    @app.cli.command('index-submissions')
+    def index_submissions():
+        """Check existing submissions for near-duplicates."""
+        from similarity import index_all_submissions
+        indexed, flagged = index_all_submissions(log=click.echo)
+        click.echo(f'Indexed {indexed} submission(s), flagged {flagged} similar pair(s)')
+
+    @app.cli.command('import-users')
+    @click.argument('csv_file', type=click.File('rb'))
+    @click.option('--dry-run', is_flag=True, help='Only check the file; create nobody.')
+    def import_users_command(csv_file, dry_run):
+        """Create users from a CSV file (name, role, username, student_number, password)."""
+        from concurrent.futures import ProcessPoolExecutor
+        from config import Config
+        from user_import import import_users
+        # A pool of its own, so the import can use every core
+        with ProcessPoolExecutor(max_workers=Config.PASSWORD_HASH_WORKERS) as pool:
+            report = import_users(csv_file, dry_run=dry_run, pool=pool)
+        for line, message in report['errors']:
+            click.echo(f'  line {line}: {message}')
+        verb = 'Would import' if dry_run else 'Imported'
+        click.echo(f"{verb} {report['created']} of {report['rows']} user(s), {len(report['errors'])} error(s)")
+
+    @app.cli.command('delete-user')
+    @click.argument('user_id', type=int)
+    @click.option('--archive', is_flag=True, help='Keep the rows in the archive tables.')
+    @click.option('--batch-size', type=int, help='Rows removed per transaction (default 500).')
+    def delete_user_command(user_id, archive, batch_size):
+        """Delete a user and everything that belongs to them, in batches."""
+        import deletion
+        from models import User
+        user = User.query.get(user_id)
+        if not user:
+            raise click.ClickException(f'No user #{user_id}')
+        counts = deletion.delete_user(user, archive=archive, batch_size=batch_size or deletion.BATCH_SIZE,
+                                      progress=_echo_progress)
+        click.echo(f"{'Archived' if archive else 'Deleted'} {sum(counts.values())} row(s)")
+
+    @app.cli.command('delete-course')
+    @click.argument('course_id', type=int)
+    @click.option('--archive', is_flag=True, help='Keep the rows in the archive tables.')
+    @click.option('--batch-size', type=int, help='Rows removed per transaction (default 500).')
+    def delete_course_command(course_id, archive, batch_size):
+        """Delete a course and everything in it, in batches."""
+        import deletion
+        from models import Course
+        course = Course.query.get(course_id)
+        if not course:
+            raise click.ClickException(f'No course #{course_id}')
+        counts = deletion.delete_course(course, archive=archive, batch_size=batch_size or deletion.BATCH_SIZE,
+                                        progress=_echo_progress)
+        click.echo(f"{'Archived' if archive else 'Deleted'} {sum(counts.values())} row(s)")
+
+    @app.cli.group('maint')
+    def maint():
+        """Routine maintenance, safe to run on a live site: work is done in
+        batches with short transactions."""
+
+    @maint.command('check')
+    @click.option('--batch-size', type=int, help='Rows read per query (default 1000).')
+    def check_command(batch_size):
+        """Look for broken references and wrong blob reference counts."""
+        import maintenance
+        problems = maintenance.check_integrity(batch_size=batch_size or maintenance.BATCH_SIZE, log=click.echo)
+        if problems:
+            raise click.ClickException(f'Found {problems} problem(s)')
+        click.echo('No problems found')
+
+    @maint.command('analyze')
+    @click.option('--reindex', is_flag=True, help='Also rebuild indexes concurrently (PostgreSQL).')
+    def analyze_command(reindex):
+        """Refresh planner statistics and merge the full-text indexes."""
+        import maintenance
+        maintenance.analyze(reindex=reindex, log=click.echo)
+
+    @maint.command('rollups')
+    @click.option('--batch-size', type=int, help='Blobs recounted per transaction (default 1000).')
+    def rollups_command(batch_size):
+        """Recount the stored reference count of every blob."""
+        import maintenance
+        fixed = maintenance.rebuild_blob_counts(batch_size=batch_size or maintenance.BATCH_SIZE, log=click.echo)
+        click.echo(f'Corrected {fixed} blob reference count(s)')
+
+    maint.add_command(reconcile_uploads_command, 'reconcile')
+
+    @maint.command('compact-notifications')
+    @click.option('--older-than-days', type=int,
+                  help='Age of read notifications to remove (default NOTIFICATION_RETENTION_DAYS).')
+    @click.option('--batch-size', type=int, help='Notification ids covered per transaction (default 1000).')
+    def compact_notifications_command(older_than_days, batch_size):
+        """Delete old notifications that have been read."""
+        import maintenance
+        deleted = maintenance.compact_notifications(older_than_days, batch_size=batch_size or maintenance.BATCH_SIZE,
+                                                    log=click.echo)
+        click.echo(f'Deleted {deleted} notification(s)')
+
+    @maint.command('prune-changes')
+    @click.option('--older-than-days', type=int, help='Age of entries to remove (default SYNC_LOG_RETENTION_DAYS).')
+    @click.option('--batch-size', type=int, help='Entry ids covered per transaction (default 1000).')
+    def prune_changes_command(older_than_days, batch_size):
+        """Delete old entries of the sync change log."""
+        import maintenance
+        deleted = maintenance.prune_change_log(older_than_days, batch_size=batch_size or maintenance.BATCH_SIZE,
+                                               log=click.echo)
+        click.echo(f'Deleted {deleted} change log entries')
+
+    @maint.command('warm-cache')
+    def warm_cache_command():
+        """Fill the shared caches after a deploy or a cache wipe."""
+        import maintenance
+        with app.test_request_context():
+            maintenance.warm_caches(log=click.echo)
+        click.echo('Caches warmed')
+
+    @maint.command('sweep-cache')
+    def sweep_cache_command():
+        """Remove expired entries from the shared cache folder."""
+        import maintenance
+        maintenance.sweep_caches(log=click.echo)
+        click.echo('Cache swept')
+
+    @maint.command('timings')
+    @click.option('--repeat', type=int, default=5, show_default=True, help='Runs of each query.')
+    def timings_command(repeat):
+        """Time the queries behind the busiest pages (min / median / max ms)."""
+        import maintenance
+        click.echo(f"  {'query':<30} {'min':>8} {'median':>8} {'max':>8}")
+        maintenance.time_queries(repeat=repeat, log=click.echo)
+
+def _echo_progress(table_name, count):
+    click.echo(f'  {table_name}: {count}')
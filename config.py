@@ -1,24 +1,112 @@
-import os
-
-class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'abiathar-secret-key-2024'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///abiathar.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    UPLOAD_FOLDER = 'static/uploads'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    
-    COURSES = ['Accounting', 'Math', 'Physics']
-    
-    # Allowed file extensions for assignments
-    ALLOWED_EXTENSIONS = {
-        'pdf', 'doc', 'docx', 'txt', 
-        'jpg', 'jpeg', 'png', 'gif',
-        'zip', 'rar', 'ppt', 'pptx'
-    }
-    
-    # Allowed file extensions for lecture materials
-    ALLOWED_MATERIAL_EXTENSIONS = {
-        'pdf', 'doc', 'docx', 'txt', 'ppt', 'pptx',
-        'jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avi',
-        'zip', 'rar', 'mp3', 'wav'
-    }
\ No newline at end of file
+import os
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'abiathar-secret-key-2024'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///abiathar.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    UPLOAD_FOLDER = 'static/uploads'
+    
+    # Where uploads are stored: 'local' (UPLOAD_FOLDER) or 's3' for any
+    # S3-compatible object store (AWS, MinIO, ...), which needs boto3
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+    S3_REGION = os.environ.get('S3_REGION')
+    S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+    # Lifetime (seconds) of the presigned download URLs handed out with S3
+    PRESIGNED_URL_EXPIRES = 300
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size (per request)
+    
+    # How downloads are transferred once a route has authorised them:
+    # 'direct' streams from the worker, 'x-accel' hands the file to nginx and
+    # 'x-sendfile' to Apache (mod_xsendfile) or lighttpd
+    FILE_SERVING_MODE = os.environ.get('FILE_SERVING_MODE', 'direct')
+    # nginx `internal` location aliased to UPLOAD_FOLDER (x-accel mode)
+    X_ACCEL_LOCATION = os.environ.get('X_ACCEL_LOCATION', '/protected-uploads/')
+    
+    # Browser cache lifetime (seconds) for downloads whose content hash is known
+    DOWNLOAD_MAX_AGE = 3600
+    
+    # Large materials (lecture videos) are sent in parts of this size
+    UPLOAD_PART_SIZE = 8 * 1024 * 1024
+    MAX_MATERIAL_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024  # 4GB
+    # Unfinished chunked uploads idle for longer than this are deleted
+    UPLOAD_SESSION_TTL_HOURS = 24
+    # The upload reconciler never deletes files younger than this, since a
+    # request may have saved a file but not yet committed its row
+    RECONCILE_GRACE_MINUTES = 60
+    
+    # Preview images for PDF and image materials, rendered in the background
+    # worker pool and cached on local disk by content hash
+    PREVIEW_CACHE_FOLDER = os.environ.get('PREVIEW_CACHE_FOLDER', 'preview_cache')
+    PREVIEW_CACHE_MAX_BYTES = 500 * 1024 * 1024  # Least recently used previews are evicted past this
+    PREVIEW_MAX_AGE = 365 * 24 * 3600  # Previews are keyed by content hash, so never go stale
+    # Submissions to the same assignment at least this similar (0-1) are flagged
+    SIMILARITY_THRESHOLD = 0.7
+    # Processes for CPU-heavy background work such as rendering previews
+    BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+    # Shared on-disk cache used by every worker process on this host
+    CACHE_FOLDER = os.environ.get('CACHE_FOLDER', 'cache')
+    # Longest the admin dashboard statistics may lag behind the database
+    DASHBOARD_CACHE_SECONDS = 60
+    # Where rendered page fragments are cached: 'memory' (each worker keeps
+    # FRAGMENT_CACHE_SIZE of them) or 'file' (CACHE_FOLDER, shared by workers)
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'memory')
+    FRAGMENT_CACHE_SIZE = 1000
+    # A fragment is rendered again after this long. Expired ones, including
+    # those of superseded versions, are removed from CACHE_FOLDER by
+    # `flask maint sweep-cache`
+    FRAGMENT_CACHE_SECONDS = 24 * 3600
+    # Course and user names kept in each worker's memory (least recently used
+    # go first), and how often a worker checks whether another one changed them
+    REFERENCE_CACHE_SIZE = 10000
+    REFERENCE_CACHE_CHECK_SECONDS = 1
+    # Read notifications older than this are removed by `flask maint compact-notifications`
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+    # JSON API (/api/v1): rows per page by default and at most, ids per
+    # batch request, and responses at least this large are gzipped
+    API_PAGE_SIZE = 50
+    API_MAX_PAGE_SIZE = 200
+    API_MAX_BATCH_IDS = 100
+    API_GZIP_MIN_BYTES = 1024
+    API_GZIP_LEVEL = 6
+    # Change log entries per /api/v1/sync response, and how long entries are
+    # kept (`flask maint prune-changes`); older cursors must reload everything
+    SYNC_PAGE_SIZE = 500
+    SYNC_LOG_RETENTION_DAYS = int(os.environ.get('SYNC_LOG_RETENTION_DAYS', 30))
+    # Announcements per page of a student's feed, and how many of each
+    # course's newest announcements are kept cached as its timeline
+    ANNOUNCEMENTS_PER_PAGE = 20
+    ANNOUNCEMENT_TIMELINE_SIZE = 50
+    # Largest CSV file the admin import form accepts; each row's password
+    # is hashed in the shared background pool while the request waits
+    IMPORT_WEB_MAX_ROWS = 200
+    # Level of the app's own log messages (startup time, background job errors)
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    # Processes hashing passwords during `flask import-users`
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    
+    COURSES = ['Accounting', 'Math', 'Physics']
+    
+    # Allowed file extensions for assignments
+    ALLOWED_EXTENSIONS = {
+        'pdf', 'doc', 'docx', 'txt', 
+        'jpg', 'jpeg', 'png', 'gif',
+        'zip', 'rar', 'ppt', 'pptx'
+    }
+    
+    # Allowed file extensions for lecture materials
+    ALLOWED_MATERIAL_EXTENSIONS = {
+        'pdf', 'doc', 'docx', 'txt', 'ppt', 'pptx',
+        'jpg', 'jpeg', 'png', 'gif', 'mp4', 'mov', 'avi',
+        'zip', 'rar', 'mp3', 'wav'
+    }
+    
+    # Due-date reminders: hours before the deadline at which students
+    # without a submission are reminded
+    REMINDER_OFFSETS_HOURS = [48, 2]
+    # How far beyond the largest offset the scheduler loads deadlines
+    REMINDER_HORIZON_HOURS = 24
+    REMINDER_POLL_SECONDS = 60
\ No newline at end of file
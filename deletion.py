@@ -0,0 +1,162 @@
+from sqlalchemy import delete, insert, literal, select
+from models import (db, ARCHIVE_TABLES, Archive, User, Course, Enrollment, Assignment, Submission,
+                    LectureMaterial, Notification, Announcement, TechIssue, UploadSession, ReminderLog,
+                    SimilarityBucket, SimilarSubmissionPair)
+from blobstore import release_all
+from cache import bump_on_commit, materials_fragment, assignments_fragment, course_announcements
+from changelog import TRACKED, record_changes
+from chunked_uploads import parts_prefix
+from search import remove_documents
+from storage import get_storage
+
+# Rows removed per transaction, so no single commit holds the write lock for long
+BATCH_SIZE = 500
+
+def _user_plan(user_id):
+    """(model, criterion) steps that remove a user and everything that belongs to them.
+
+    Children come before their parents; the user row goes last, so an
+    interrupted delete can simply be run again.
+    """
+    assignments = select(Assignment.id).where(Assignment.teacher_id == user_id)
+    return [
+        (Submission, db.or_(Submission.student_id == user_id, Submission.assignment_id.in_(assignments))),
+        (Assignment, Assignment.teacher_id == user_id),
+        (LectureMaterial, LectureMaterial.teacher_id == user_id),
+        (Enrollment, Enrollment.user_id == user_id),
+        (Notification, Notification.user_id == user_id),
+        (Announcement, Announcement.teacher_id == user_id),
+        (TechIssue, TechIssue.user_id == user_id),
+        (UploadSession, UploadSession.teacher_id == user_id),
+        (User, User.id == user_id)
+    ]
+
+def _course_plan(course_id):
+    """(model, criterion) steps that remove a course and everything in it"""
+    assignments = select(Assignment.id).where(Assignment.course_id == course_id)
+    return [
+        (Submission, Submission.assignment_id.in_(assignments)),
+        (Assignment, Assignment.course_id == course_id),
+        (LectureMaterial, LectureMaterial.course_id == course_id),
+        (Enrollment, Enrollment.course_id == course_id),
+        (Announcement, Announcement.course_id == course_id),
+        (UploadSession, UploadSession.course_id == course_id),
+        (Course, Course.id == course_id)
+    ]
+
+# Rows derived from a batch, which go with it and are never archived, and
+# cached fragments that showed it
+
+def _remove_submission_children(ids):
+    SimilarityBucket.query.filter(SimilarityBucket.submission_id.in_(ids)).delete(synchronize_session=False)
+    SimilarSubmissionPair.query.filter(db.or_(
+        SimilarSubmissionPair.submission_id.in_(ids), SimilarSubmissionPair.other_submission_id.in_(ids)
+    )).delete(synchronize_session=False)
+
+def _bump_course_fragments(model, fragment, ids):
+    course_ids = {course_id for (course_id,) in db.session.query(model.course_id).filter(model.id.in_(ids)).distinct()}
+    bump_on_commit(*(fragment(course_id) for course_id in course_ids))
+
+def _remove_assignment_children(ids):
+    _bump_course_fragments(Assignment, assignments_fragment, ids)
+    ReminderLog.query.filter(ReminderLog.assignment_id.in_(ids)).delete(synchronize_session=False)
+    SimilarityBucket.query.filter(SimilarityBucket.assignment_id.in_(ids)).delete(synchronize_session=False)
+    SimilarSubmissionPair.query.filter(SimilarSubmissionPair.assignment_id.in_(ids)).delete(synchronize_session=False)
+    remove_documents('assignment', ids)
+
+def _remove_material_children(ids):
+    _bump_course_fragments(LectureMaterial, materials_fragment, ids)
+    remove_documents('material', ids)
+
+def _remove_announcement_children(ids):
+    _bump_course_fragments(Announcement, course_announcements, ids)
+
+def _remove_upload_parts(ids):
+    for upload_id in ids:
+        get_storage().delete_prefix(parts_prefix(upload_id))
+
+CHILDREN = {
+    Submission: _remove_submission_children,
+    Assignment: _remove_assignment_children,
+    LectureMaterial: _remove_material_children,
+    Announcement: _remove_announcement_children,
+    UploadSession: _remove_upload_parts
+}
+
+def _released_paths(model, ids):
+    """Stored files referenced by a batch of rows"""
+    if model is LectureMaterial:
+        return [path for (path,) in db.session.query(LectureMaterial.file_path).filter(
+            LectureMaterial.id.in_(ids), LectureMaterial.file_type != 'link'
+        )]
+    if model in (Assignment, Submission):
+        return [path for (path,) in db.session.query(model.file_path).filter(model.id.in_(ids))]
+    return []
+
+def _run_plan(plan, archive_id=None, batch_size=BATCH_SIZE, progress=None):
+    """Delete every step's rows in batches of set-based statements, one commit per batch.
+
+    When archiving, each batch is first copied to its archived_* table in
+    the same transaction and its files are kept for the archived rows;
+    otherwise the files are released. Returns {table name: rows deleted}.
+    """
+    counts = {}
+    for model, criterion in plan:
+        table_name = model.__tablename__
+        counts[table_name] = 0
+        while True:
+            ids = [row_id for (row_id,) in db.session.query(model.id).filter(criterion)
+                   .order_by(model.id).limit(batch_size)]
+            if not ids:
+                break
+
+            if model in CHILDREN:
+                CHILDREN[model](ids)
+            if archive_id and model in ARCHIVE_TABLES:
+                columns = list(model.__table__.columns)
+                db.session.execute(insert(ARCHIVE_TABLES[model]).from_select(
+                    [column.name for column in columns] + ['archive_id'],
+                    select(*columns, literal(archive_id)).where(model.id.in_(ids))
+                ))
+            elif not archive_id:
+                release_all(_released_paths(model, ids))
+            if model in TRACKED:
+                record_changes(model, ids, 'delete')
+            db.session.execute(delete(model).where(model.id.in_(ids)),
+                               execution_options={'synchronize_session': False})
+            db.session.commit()
+
+            counts[table_name] += len(ids)
+            if progress:
+                progress(table_name, counts[table_name])
+    return counts
+
+def _start_archive(kind, subject_id, label, archived_by):
+    archive = Archive(kind=kind, subject_id=subject_id, label=label, archived_by=archived_by)
+    db.session.add(archive)
+    db.session.commit()
+    return archive.id
+
+def delete_user(user, archive=False, archived_by=None, batch_size=BATCH_SIZE, progress=None):
+    """Delete a user with their enrollments, submissions, notifications and,
+    for teachers, the assignments (with their submissions) and materials
+    they posted. With archive=True the rows are kept in the archive tables.
+
+    progress(table name, rows deleted so far) is called after each batch.
+    Returns {table name: rows deleted}.
+    """
+    user_id = user.id
+    archive_id = _start_archive('user', user_id, user.name, archived_by) if archive else None
+    return _run_plan(_user_plan(user_id), archive_id, batch_size, progress)
+
+def delete_course(course, archive=False, archived_by=None, batch_size=BATCH_SIZE, progress=None):
+    """Delete a course with its enrollments, assignments, submissions,
+    materials and announcements; see delete_user()."""
+    course_id = course.id
+    archive_id = _start_archive('course', course_id, course.name, archived_by) if archive else None
+    return _run_plan(_course_plan(course_id), archive_id, batch_size, progress)
+
+def describe_counts(counts):
+    """'12 enrollments, 40 submissions' for the tables that lost rows besides the subject itself"""
+    return ', '.join(f'{count} {table_name.replace("_", " ")}(s)'
+                     for table_name, count in counts.items() if count and table_name not in ('user', 'course'))
@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import unicodedata
+from urllib.parse import quote
+from flask import request, send_file, current_app, abort, redirect
+from werkzeug.http import dump_options_header
+from blobstore import upload_full_path, blob_sha256, storage_key
+from storage import get_storage
+from config import Config
+
+# Types a browser may render in the page instead of saving to disk
+INLINE_MIMETYPE_PREFIXES = ('video/', 'audio/', 'image/')
+INLINE_MIMETYPES = {'application/pdf'}
+
+def can_show_inline(mimetype):
+    return mimetype in INLINE_MIMETYPES or mimetype.startswith(INLINE_MIMETYPE_PREFIXES)
+
+def send_upload(file_path, download_name, inline=None):
+    """Send a stored upload with Range, ETag and conditional GET support.
+
+    Range requests get 206 partial responses so audio and video can be
+    seeked, and If-None-Match / If-Modified-Since get 304 Not Modified.
+    Blobs use their SHA-256 as a strong ETag; legacy uploads fall back to
+    an mtime/size tag. Pass inline=True (or ?inline=1) to play media and
+    view PDFs in the browser.
+
+    Callers do the permission checks first. With FILE_SERVING_MODE set to
+    'x-accel' or 'x-sendfile' the bytes are then left to the front web
+    server, so the worker is free again as soon as the headers are built.
+    With S3 storage the client is redirected to a short-lived presigned
+    URL and the object store serves ranges and ETags itself.
+    """
+    if inline is None:
+        inline = request.args.get('inline') == '1'
+
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    if inline and not can_show_inline(mimetype):
+        inline = False
+
+    storage = get_storage()
+    if storage.presigned_urls:
+        return _presigned_redirect(storage, file_path, download_name, mimetype, inline)
+
+    sha256 = blob_sha256(file_path)
+    # Absolute, so send_file does not resolve it against the app root
+    full_path = os.path.abspath(upload_full_path(file_path))
+
+    if Config.FILE_SERVING_MODE in ('x-accel', 'x-sendfile'):
+        response = _offload_response(file_path, full_path, download_name, mimetype, inline, sha256)
+    else:
+        # werkzeug streams through wsgi.file_wrapper, which servers such as
+        # gunicorn turn into a zero-copy sendfile() call
+        response = send_file(
+            full_path,
+            mimetype=mimetype,
+            as_attachment=not inline,
+            download_name=download_name,
+            conditional=True,
+            etag=sha256 if sha256 else True
+        )
+
+    # Uploads are private to the people allowed to see them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if sha256:
+        # Blob content never changes under the same hash
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = Config.DOWNLOAD_MAX_AGE
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    # Tell players up front that seeking is supported
+    response.accept_ranges = 'bytes'
+
+    return response
+
+def _presigned_redirect(storage, file_path, download_name, mimetype, inline):
+    """Redirect to a presigned object URL; the bytes never touch this server"""
+    url = storage.presigned_url(
+        storage_key(file_path),
+        expires=Config.PRESIGNED_URL_EXPIRES,
+        content_type=mimetype,
+        content_disposition=dump_options_header(
+            'inline' if inline else 'attachment',
+            _filename_params(download_name)
+        )
+    )
+    response = redirect(url)
+    # The URL expires, so the redirect itself must not be cached
+    response.cache_control.no_store = True
+    return response
+
+def _offload_response(file_path, full_path, download_name, mimetype, inline, sha256):
+    """Empty response telling nginx (X-Accel-Redirect) or Apache/lighttpd
+    (X-Sendfile) to send the file. The front server handles Range itself;
+    conditional requests are still answered here without touching the file.
+    """
+    response = current_app.response_class(mimetype=mimetype)
+
+    if Config.FILE_SERVING_MODE == 'x-accel':
+        location = Config.X_ACCEL_LOCATION.rstrip('/')
+        response.headers['X-Accel-Redirect'] = f"{location}/{quote(storage_key(file_path))}"
+    else:
+        response.headers['X-Sendfile'] = full_path
+
+    response.headers.set(
+        'Content-Disposition',
+        'inline' if inline else 'attachment',
+        **_filename_params(download_name)
+    )
+
+    try:
+        stat = os.stat(full_path)
+    except FileNotFoundError:
+        abort(404)
+    response.last_modified = stat.st_mtime
+    response.set_etag(sha256 or f"{int(stat.st_mtime)}-{stat.st_size}")
+
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # Otherwise the front server would send the body anyway
+        response.headers.pop('X-Accel-Redirect', None)
+        response.headers.pop('X-Sendfile', None)
+    return response
+
+def _filename_params(download_name):
+    """Content-Disposition filename parameters, with an RFC 5987 form for non-ASCII names"""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='')}"}
+    return {'filename': download_name}
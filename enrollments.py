@@ -0,0 +1,182 @@
+import csv
+import io
+from sqlalchemy import insert, update, delete, tuple_
+from models import db, User, Course, Enrollment
+from changelog import record_changes
+
+# Keeps IN lists under SQLite's bound-parameter limit (pairs bind two each)
+CHUNK_SIZE = 5000
+
+class BulkEnrollmentError(Exception):
+    """Raised when a bulk enrollment request cannot be understood"""
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _split(value):
+    """Ids or numbers from a textarea: separated by commas, spaces or new lines"""
+    return [part for part in value.replace(',', ' ').split() if part]
+
+def parse_bulk_request(request):
+    """Students and courses of a bulk request, from JSON, an uploaded CSV or form fields.
+
+    JSON: {"student_ids": [...], "student_numbers": [...], "course_ids": [...]}
+    CSV: a student_id or student_number column, and optionally course_id;
+    rows without a course use the courses picked in the form.
+    Form: student_numbers (free text) and student_ids / course_ids fields.
+
+    Returns (student_ids, student_numbers, course_ids, pairs) where pairs
+    are (student ref, course id) rows that came with their own course.
+    """
+    pairs = []
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        student_ids = data.get('student_ids') or []
+        student_numbers = data.get('student_numbers') or []
+        course_ids = data.get('course_ids') or []
+    else:
+        student_ids = request.form.getlist('student_ids')
+        student_numbers = _split(request.form.get('student_numbers', ''))
+        course_ids = request.form.getlist('course_ids')
+
+        file = request.files.get('csv_file')
+        if file and file.filename:
+            csv_ids, csv_numbers, pairs = _parse_csv(file.stream)
+            student_ids += csv_ids
+            student_numbers += csv_numbers
+
+    try:
+        student_ids = {int(student_id) for student_id in student_ids}
+        course_ids = {int(course_id) for course_id in course_ids}
+    except (TypeError, ValueError):
+        raise BulkEnrollmentError('Student and course ids must be numbers')
+    return student_ids, {str(number).strip() for number in student_numbers}, course_ids, pairs
+
+def _parse_csv(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    columns = set(reader.fieldnames or [])
+    if not columns & {'student_id', 'student_number'}:
+        raise BulkEnrollmentError('The CSV needs a student_id or student_number column')
+
+    student_ids, student_numbers, pairs = [], [], []
+    for row in reader:
+        student_id = (row.get('student_id') or '').strip()
+        student_number = (row.get('student_number') or '').strip()
+        course_id = (row.get('course_id') or '').strip()
+        if student_id:
+            ref = ('id', int(student_id)) if student_id.isdigit() else None
+        elif student_number:
+            ref = ('number', student_number)
+        else:
+            continue
+        if ref is None:
+            raise BulkEnrollmentError(f'Line {reader.line_num}: student_id must be a number')
+
+        if course_id:
+            if not course_id.isdigit():
+                raise BulkEnrollmentError(f'Line {reader.line_num}: course_id must be a number')
+            pairs.append((ref, int(course_id)))
+        elif ref[0] == 'id':
+            student_ids.append(ref[1])
+        else:
+            student_numbers.append(ref[1])
+    return student_ids, student_numbers, pairs
+
+def resolve_pairs(student_ids, student_numbers, course_ids, pairs=()):
+    """(user_id, course_id) pairs to act on: every listed student times every
+    listed course, plus the CSV rows that named their own course.
+
+    Students and courses are looked up with one query per chunk of ids.
+    Returns (pairs, unknown) where unknown lists refs that matched nothing.
+    """
+    pair_ids = {ref[1] for ref, course_id in pairs if ref[0] == 'id'}
+    pair_numbers = {ref[1] for ref, course_id in pairs if ref[0] == 'number'}
+
+    by_id = {}
+    by_number = {}
+    for chunk in _chunks(student_ids | pair_ids):
+        for (user_id,) in db.session.query(User.id).filter(User.role == 'student', User.id.in_(chunk)):
+            by_id[user_id] = user_id
+    for chunk in _chunks(student_numbers | pair_numbers):
+        for user_id, number in db.session.query(User.id, User.student_number).filter(
+            User.role == 'student', User.student_number.in_(chunk)
+        ):
+            by_number[number] = user_id
+
+    all_course_ids = course_ids | {course_id for ref, course_id in pairs}
+    known_courses = {course_id for (course_id,) in
+                     db.session.query(Course.id).filter(Course.id.in_(all_course_ids))} if all_course_ids else set()
+
+    unknown = sorted(
+        [f'student #{student_id}' for student_id in student_ids | pair_ids if student_id not in by_id] +
+        [f'student {number}' for number in student_numbers | pair_numbers if number not in by_number] +
+        [f'course #{course_id}' for course_id in all_course_ids - known_courses]
+    )
+
+    users = [by_id[student_id] for student_id in student_ids if student_id in by_id]
+    users += [by_number[number] for number in student_numbers if number in by_number]
+    result = {(user_id, course_id) for user_id in users for course_id in course_ids & known_courses}
+
+    lookup = {'id': by_id, 'number': by_number}
+    for (kind, value), course_id in pairs:
+        user_id = lookup[kind].get(value)
+        if user_id and course_id in known_courses:
+            result.add((user_id, course_id))
+    return result, unknown
+
+def _existing_enrollments(pairs):
+    """{(user_id, course_id): (enrollment id, status)} for the pairs that are already enrolled"""
+    existing = {}
+    for chunk in _chunks(pairs):
+        rows = db.session.query(Enrollment.id, Enrollment.user_id, Enrollment.course_id, Enrollment.status).filter(
+            tuple_(Enrollment.user_id, Enrollment.course_id).in_(chunk)
+        )
+        for enrollment_id, user_id, course_id, status in rows:
+            existing[(user_id, course_id)] = (enrollment_id, status)
+    return existing
+
+def bulk_enroll(pairs, enrolled_by):
+    """Enroll every (user_id, course_id) pair in one transaction.
+
+    Pairs that are enrolled already are left alone, inactive enrollments
+    are reactivated and the rest are inserted with one executemany.
+    Returns {'enrolled', 'reactivated', 'already_enrolled'}.
+    """
+    existing = _existing_enrollments(pairs)
+    new_rows = [{'user_id': user_id, 'course_id': course_id, 'enrolled_by': enrolled_by, 'status': 'active'}
+                for user_id, course_id in sorted(pairs) if (user_id, course_id) not in existing]
+    inactive_ids = [enrollment_id for enrollment_id, status in existing.values() if status != 'active']
+
+    if new_rows:
+        db.session.execute(insert(Enrollment), new_rows)
+        inserted = _existing_enrollments([(row['user_id'], row['course_id']) for row in new_rows])
+        record_changes(Enrollment, [enrollment_id for enrollment_id, status in inserted.values()])
+    for chunk in _chunks(inactive_ids):
+        db.session.execute(
+            update(Enrollment).where(Enrollment.id.in_(chunk)).values(status='active'),
+            execution_options={'synchronize_session': False}
+        )
+    record_changes(Enrollment, inactive_ids)
+    db.session.commit()
+
+    return {
+        'enrolled': len(new_rows),
+        'reactivated': len(inactive_ids),
+        'already_enrolled': len(existing) - len(inactive_ids)
+    }
+
+def bulk_drop(pairs):
+    """Drop every (user_id, course_id) pair in one transaction. Returns the number dropped."""
+    dropped = 0
+    for chunk in _chunks(sorted(pairs)):
+        record_changes(Enrollment, [enrollment_id for enrollment_id, status in _existing_enrollments(chunk).values()],
+                       'delete')
+        result = db.session.execute(
+            delete(Enrollment).where(tuple_(Enrollment.user_id, Enrollment.course_id).in_(chunk)),
+            execution_options={'synchronize_session': False}
+        )
+        dropped += result.rowcount
+    db.session.commit()
+    return dropped
@@ -0,0 +1,55 @@
+import hashlib
+import os
+from flask import current_app, g, request, session
+from flask.globals import request_ctx
+from flask_login import current_user
+
+def _templates_stamp():
+    """Changes whenever a template is edited, so a deploy never serves 304s
+    for pages whose markup has changed"""
+    folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+    stamp = hashlib.sha1()
+    for root, dirs, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            info = os.stat(os.path.join(root, name))
+            stamp.update(f'{name}:{info.st_mtime_ns}:{info.st_size};'.encode('utf-8'))
+    return stamp.hexdigest()
+
+_deploy_stamp = _templates_stamp()
+
+def _set_etag(response, etag):
+    response.set_etag(etag, weak=True)
+    # The browser keeps the page but asks again on every visit
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+def not_modified(*versions):
+    """A 304 response if the browser's copy of this page is current, else None.
+
+    Call it once the access checks have passed and before the page's own
+    queries run. versions are cheap stamps of everything the page shows;
+    the weak ETag also covers the URL, the user (whose name is in the
+    header) and the templates. When None is returned the ETag is added to
+    the page on its way out.
+    """
+    # A pending flash message is shown once, so that page must not be reused
+    if '_flashes' in session:
+        return None
+    etag = hashlib.sha1(repr((
+        _deploy_stamp, request.full_path, current_user.id, current_user.name, current_user.role, versions
+    )).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        _set_etag(response, etag)
+        return response
+    g.etag = etag
+    return None
+
+def _add_etag(response):
+    etag = g.pop('etag', None)
+    # Skip pages that showed a flash message after the check
+    if etag and response.status_code == 200 and not getattr(request_ctx, 'flashes', None):
+        _set_etag(response, etag)
+    return response
+
+def register_etags(app):
+    app.after_request(_add_etag)
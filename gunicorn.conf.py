@@ -0,0 +1,34 @@
+# gunicorn settings, read automatically by `gunicorn wsgi:app`
+import os
+import time
+import multiprocessing
+
+_config_loaded = time.perf_counter()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = 120  # Large uploads and downloads stream through the workers
+
+# Import and build the app once in the master; workers are forked with it
+# already loaded, so they start in milliseconds and share its memory
+preload_app = True
+
+accesslog = '-'
+
+def when_ready(server):
+    server.log.info('Master ready in %.0f ms', (time.perf_counter() - _config_loaded) * 1000)
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+    # Connections, the storage client and the background pool opened in the
+    # master must not be shared across the fork
+    from models import db
+    from workers import after_fork
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
+    after_fork()
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s booted in %.0f ms', worker.pid, (time.perf_counter() - worker.forked_at) * 1000)
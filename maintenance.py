@@ -0,0 +1,274 @@
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import literal, text
+from models import (db, User, Course, Enrollment, Assignment, Submission, LectureMaterial, Notification, Blob, ChangeLog,
+                    FILE_PATH_COLUMNS)
+from blobstore import BLOB_FOLDER
+from cache import bump_on_commit, content_version, user_notifications
+from changelog import record_changes
+from config import Config
+
+# Rows read or changed per statement; every write batch is its own transaction
+BATCH_SIZE = 1000
+
+# (description, child model, foreign key column, parent model)
+REFERENCES = [
+    ('enrollments of missing users', Enrollment, Enrollment.user_id, User),
+    ('enrollments in missing courses', Enrollment, Enrollment.course_id, Course),
+    ('assignments in missing courses', Assignment, Assignment.course_id, Course),
+    ('assignments by missing teachers', Assignment, Assignment.teacher_id, User),
+    ('submissions to missing assignments', Submission, Submission.assignment_id, Assignment),
+    ('submissions by missing students', Submission, Submission.student_id, User),
+    ('materials in missing courses', LectureMaterial, LectureMaterial.course_id, Course),
+    ('notifications of missing users', Notification, Notification.user_id, User)
+]
+
+def _id_ranges(model, batch_size):
+    """(low, high) id windows covering a table, so each statement only
+    touches a slice of the primary key"""
+    low, high = db.session.query(db.func.min(model.id), db.func.max(model.id)).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch_size):
+        yield start, start + batch_size
+
+def check_integrity(batch_size=BATCH_SIZE, log=print):
+    """Report rows pointing at missing parents and stale blob reference
+    counts (plus SQLite's own quick_check). Only reads, a slice at a time.
+    Returns the number of problems found."""
+    problems = 0
+    if db.engine.dialect.name == 'sqlite':
+        result = [row for (row,) in db.session.execute(text('PRAGMA quick_check'))]
+        db.session.rollback()
+        if result != ['ok']:
+            problems += len(result)
+            for line in result:
+                log(f'  quick_check: {line}')
+
+    for description, model, column, parent in REFERENCES:
+        found = 0
+        for low, high in _id_ranges(model, batch_size):
+            found += db.session.query(db.func.count(model.id)).filter(
+                model.id >= low, model.id < high, column.isnot(None),
+                ~db.select(parent.id).where(parent.id == column).exists()
+            ).scalar()
+            db.session.rollback()
+        if found:
+            log(f'  {found} {description}')
+        problems += found
+
+    drifted = rebuild_blob_counts(dry_run=True, batch_size=batch_size, log=log)
+    if drifted:
+        log(f'  {drifted} blob(s) with a wrong reference count (fix with `flask maint rollups`)')
+    return problems + drifted
+
+def _blob_references():
+    """Correlated count of the rows whose file_path points at Blob.sha256,
+    archived rows included.
+
+    Blob paths are blobs/ab/<sha>[.ext], so this is a range scan on each
+    file_path index.
+    """
+    key = literal(BLOB_FOLDER + '/') + db.func.substr(Blob.sha256, 1, 2) + '/' + Blob.sha256
+    counts = [
+        db.select(db.func.count()).where(column >= key, column < key + '/').scalar_subquery()
+        for column in FILE_PATH_COLUMNS
+    ]
+    total = counts[0]
+    for count in counts[1:]:
+        total = total + count
+    return total
+
+def rebuild_blob_counts(dry_run=False, batch_size=BATCH_SIZE, log=print):
+    """Recount Blob.ref_count from the rows that reference each blob.
+
+    Blobs are walked in batches of their keys; each batch is corrected by
+    one UPDATE in its own short transaction. Returns how many blobs had
+    the wrong count.
+    """
+    references = _blob_references()
+    after = ''
+    total = checked = 0
+    while True:
+        keys = [sha256 for (sha256,) in db.session.query(Blob.sha256).filter(Blob.sha256 > after)
+                .order_by(Blob.sha256).limit(batch_size)]
+        if not keys:
+            break
+        after = keys[-1]
+        wrong = Blob.__table__.c.sha256.in_(keys) & (Blob.__table__.c.ref_count != references)
+        if dry_run:
+            total += db.session.execute(db.select(db.func.count()).select_from(Blob).where(wrong)).scalar()
+            db.session.rollback()
+        else:
+            total += db.session.execute(
+                Blob.__table__.update().where(wrong).values(ref_count=references)
+            ).rowcount
+            db.session.commit()
+        checked += len(keys)
+        log(f'  blobs: {checked} checked, {total} wrong')
+    return total
+
+def analyze(reindex=False, log=print):
+    """Refresh the query planner's statistics table by table.
+
+    On SQLite ANALYZE samples a bounded number of rows per index and the
+    full-text indexes are merged incrementally, so no step holds the write
+    lock for long. On PostgreSQL, reindex=True also rebuilds each table's
+    indexes with REINDEX CONCURRENTLY, which does not block writes.
+    """
+    dialect = db.engine.dialect.name
+    tables = sorted(db.metadata.tables)
+    with db.engine.connect() as connection:
+        if dialect == 'sqlite':
+            connection.execute(text('PRAGMA analysis_limit = 1000'))
+        elif reindex:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+        for table in tables:
+            started = time.perf_counter()
+            connection.execute(text(f'ANALYZE "{table}"'))
+            if reindex and dialect == 'postgresql':
+                connection.execute(text(f'REINDEX TABLE CONCURRENTLY "{table}"'))
+            connection.commit()
+            log(f'  {table}: {(time.perf_counter() - started) * 1000:.0f} ms')
+        if dialect == 'sqlite':
+            for table in ('search_index', 'user_search'):
+                _merge_fts(connection, table, log)
+
+def _merge_fts(connection, table, log):
+    """Merge an FTS5 index's segments a few hundred pages per transaction,
+    until a step has nothing left to do"""
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': table}).first()
+    if not exists:
+        return
+    steps = 0
+    while True:
+        before = connection.execute(text('SELECT total_changes()')).scalar()
+        connection.execute(text(f"INSERT INTO {table} ({table}, rank) VALUES ('merge', 500)"))
+        changed = connection.execute(text('SELECT total_changes()')).scalar() - before
+        connection.commit()
+        steps += 1
+        if changed < 2:
+            break
+    log(f'  {table}: merged in {steps} step(s)')
+
+def compact_notifications(older_than_days=None, batch_size=BATCH_SIZE, log=print):
+    """Delete read notifications older than NOTIFICATION_RETENTION_DAYS, a
+    slice of ids per transaction. Returns the number deleted."""
+    days = older_than_days if older_than_days is not None else Config.NOTIFICATION_RETENTION_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = 0
+    for low, high in _id_ranges(Notification, batch_size):
+        old = Notification.query.filter(
+            Notification.id >= low, Notification.id < high,
+            Notification.is_read.is_(True),
+            Notification.created_at < cutoff
+        )
+        rows = old.with_entities(Notification.id, Notification.user_id).all()
+        user_ids = {user_id for notification_id, user_id in rows}
+        if user_ids:
+            record_changes(Notification, [notification_id for notification_id, user_id in rows], 'delete')
+            deleted += old.delete(synchronize_session=False)
+            bump_on_commit(*(user_notifications(user_id) for user_id in user_ids))
+        db.session.commit()
+        if user_ids:
+            log(f'  notifications: {deleted} deleted')
+    return deleted
+
+def prune_change_log(older_than_days=None, batch_size=BATCH_SIZE, log=print):
+    """Delete change log entries older than SYNC_LOG_RETENTION_DAYS, a slice
+    of ids per transaction. The newest entry is always kept, so the sync
+    feed can tell that older cursors have expired. Returns the number deleted."""
+    days = older_than_days if older_than_days is not None else Config.SYNC_LOG_RETENTION_DAYS
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    newest = db.session.query(db.func.max(ChangeLog.id)).scalar()
+    deleted = 0
+    for low, high in _id_ranges(ChangeLog, batch_size):
+        deleted += ChangeLog.query.filter(
+            ChangeLog.id >= low, ChangeLog.id < min(high, newest),
+            ChangeLog.created_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        log(f'  change log: {deleted} deleted')
+    return deleted
+
+def warm_caches(log=print):
+    """Fill the shared caches so the first visitors after a deploy or a
+    cache wipe do not pay for them. Needs a request context (for url_for)."""
+    from admin import DASHBOARD_CACHE_KEY, dashboard_snapshot
+    from announcements import course_timeline
+    from cache import get_cache
+    from student import assignment_cards, course_materials_html
+
+    for name in ('courses', 'users'):
+        content_version(name)
+    get_cache().get_or_set(DASHBOARD_CACHE_KEY, dashboard_snapshot, Config.DASHBOARD_CACHE_SECONDS)
+    log('  admin dashboard')
+
+    # Fragments kept in memory would only warm this process
+    if Config.FRAGMENT_CACHE_BACKEND != 'file':
+        log('  fragments skipped: FRAGMENT_CACHE_BACKEND is not "file"')
+        return
+    course_ids = [course_id for (course_id,) in db.session.query(Course.id).order_by(Course.id)]
+    for done, course_id in enumerate(course_ids, 1):
+        course_materials_html(course_id)
+        assignment_cards(course_id)
+        course_timeline(course_id)
+        db.session.rollback()
+        if done % 50 == 0 or done == len(course_ids):
+            log(f'  course fragments: {done}/{len(course_ids)}')
+
+def sweep_caches(log=print):
+    """Remove expired entries from the shared on-disk cache. Returns the
+    number removed."""
+    from cache import get_cache
+    removed, freed = get_cache().sweep()
+    log(f'  {removed} expired entries, {freed / (1024 * 1024):.1f} MB')
+    return removed
+
+def _sample(model, *criteria):
+    return db.session.query(model.id).filter(*criteria).order_by(model.id).limit(1).scalar()
+
+def hot_queries():
+    """(name, callable) for the queries behind the busiest pages, run
+    against the first student, teacher and user found"""
+    from admin import course_stats_query, dashboard_snapshot, COURSES_PER_PAGE
+    from announcements import feed_course_ids, student_feed
+    from notifications import get_unread_count
+    from search import search_for_student, search_users
+    from student import dashboard_version
+    from teacher import assignments_version
+
+    student_id = _sample(User, User.role == 'student')
+    teacher_id = _sample(User, User.role == 'teacher')
+    name = db.session.query(User.name).order_by(User.id).limit(1).scalar() or 'a'
+    queries = [
+        ('admin dashboard', dashboard_snapshot),
+        ('course list page', lambda: course_stats_query().order_by(Course.name).limit(COURSES_PER_PAGE).all()),
+        ('user directory search', lambda: search_users(name[:3]))
+    ]
+    if student_id:
+        queries += [
+            ('student dashboard version', lambda: dashboard_version(student_id)),
+            ('unread notification count', lambda: get_unread_count(student_id)),
+            ('student search', lambda: search_for_student(student_id, name[:3])),
+            ('student announcement feed', lambda: student_feed(feed_course_ids(student_id)))
+        ]
+    if teacher_id:
+        queries.append(('teacher assignments version', lambda: assignments_version(teacher_id)))
+    return queries
+
+def time_queries(repeat=5, log=print):
+    """Run each hot query repeat times and report min / median / max in ms.
+    Returns {name: median ms}."""
+    medians = {}
+    for name, run in hot_queries():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+            db.session.rollback()
+        medians[name] = statistics.median(timings)
+        log(f'  {name:<30} {min(timings):8.1f} {medians[name]:8.1f} {max(timings):8.1f}')
+    return medians
@@ -1,121 +1,268 @@
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
-
-db = SQLAlchemy()
-
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    student_number = db.Column(db.String(20), unique=True, nullable=True)
-    username = db.Column(db.String(80), unique=True, nullable=True)
-    password_hash = db.Column(db.String(128), nullable=False)
-    name = db.Column(db.String(100), nullable=False)
-    role = db.Column(db.String(20), nullable=False)
-    profile_pic = db.Column(db.String(200), default='default.png')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    # Relationships
-    enrollments = db.relationship('Enrollment', backref='student', lazy=True, foreign_keys='Enrollment.user_id')
-    assignments_created = db.relationship('Assignment', backref='teacher', lazy=True, foreign_keys='Assignment.teacher_id')
-    submissions = db.relationship('Submission', backref='student', lazy=True, foreign_keys='Submission.student_id')
-    uploaded_materials = db.relationship('LectureMaterial', backref='teacher', lazy=True, foreign_keys='LectureMaterial.teacher_id')
-    notifications = db.relationship('Notification', backref='user', lazy=True)
-    # REMOVED FORUM RELATIONSHIPS
-
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-    
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-    
-    def is_student(self):
-        return self.role == 'student'
-    
-    def is_teacher(self):
-        return self.role == 'teacher'
-    
-    def is_admin(self):
-        return self.role == 'admin'
-
-class Course(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), nullable=False)
-    description = db.Column(db.Text)
-    
-    # Relationships
-    enrollments = db.relationship('Enrollment', backref='course', lazy=True)
-    assignments = db.relationship('Assignment', backref='course', lazy=True)
-    materials = db.relationship('LectureMaterial', backref='course', lazy=True)
-    # REMOVED FORUM RELATIONSHIP
-
-class Enrollment(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
-    enrolled_by = db.Column(db.Integer, nullable=False)
-    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='active')
-
-class Assignment(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    due_date = db.Column(db.DateTime, nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    max_marks = db.Column(db.Integer, default=100)
-    file_path = db.Column(db.String(500))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
-    # Relationships
-    submissions = db.relationship('Submission', backref='assignment', lazy=True)
-
-class Submission(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
-    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    file_path = db.Column(db.String(500))
-    marks = db.Column(db.Float)
-    feedback = db.Column(db.Text)
-    status = db.Column(db.String(20), default='submitted')
-    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class LectureMaterial(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text)
-    file_path = db.Column(db.String(500))
-    file_type = db.Column(db.String(50))  # pdf, video, slide, document, link
-    week_number = db.Column(db.Integer)  # Organize by week
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    is_published = db.Column(db.Boolean, default=True)
-
-class Notification(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    title = db.Column(db.String(200), nullable=False)
-    message = db.Column(db.Text, nullable=False)
-    notification_type = db.Column(db.String(50))  # assignment, grade, announcement, material
-    related_id = db.Column(db.Integer)  # ID of related item (assignment_id, etc.)
-    is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class Announcement(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=True)
-    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-class TechIssue(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    issue_description = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='open')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-# ==================== REMOVED FORUM MODELS ====================
\ No newline at end of file
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime
+
+db = SQLAlchemy()
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    student_number = db.Column(db.String(20), unique=True, nullable=True)
+    username = db.Column(db.String(80), unique=True, nullable=True)
+    password_hash = db.Column(db.String(128), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    role = db.Column(db.String(20), nullable=False)
+    profile_pic = db.Column(db.String(200), default='default.png')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    enrollments = db.relationship('Enrollment', backref='student', lazy=True, foreign_keys='Enrollment.user_id')
+    assignments_created = db.relationship('Assignment', backref='teacher', lazy=True, foreign_keys='Assignment.teacher_id')
+    submissions = db.relationship('Submission', backref='student', lazy=True, foreign_keys='Submission.student_id')
+    uploaded_materials = db.relationship('LectureMaterial', backref='teacher', lazy=True, foreign_keys='LectureMaterial.teacher_id')
+    notifications = db.relationship('Notification', backref='user', lazy=True)
+    # REMOVED FORUM RELATIONSHIPS
+
+    __table_args__ = (
+        # The user directory pages through one role at a time by id
+        db.Index('ix_user_role_id', 'role', 'id'),
+    )
+
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+    
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+    
+    def is_student(self):
+        return self.role == 'student'
+    
+    def is_teacher(self):
+        return self.role == 'teacher'
+    
+    def is_admin(self):
+        return self.role == 'admin'
+
+class Course(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text)
+    
+    # Relationships
+    enrollments = db.relationship('Enrollment', backref='course', lazy=True)
+    assignments = db.relationship('Assignment', backref='course', lazy=True)
+    materials = db.relationship('LectureMaterial', backref='course', lazy=True)
+    # REMOVED FORUM RELATIONSHIP
+
+class Enrollment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    enrolled_by = db.Column(db.Integer, nullable=False)
+    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
+    status = db.Column(db.String(20), default='active')
+
+    __table_args__ = (
+        db.Index('ix_enrollment_course_status', 'course_id', 'status'),
+    )
+
+class Assignment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    due_date = db.Column(db.DateTime, nullable=False, index=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    max_marks = db.Column(db.Integer, default=100)
+    file_path = db.Column(db.String(500), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    submissions = db.relationship('Submission', backref='assignment', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_assignment_course_teacher', 'course_id', 'teacher_id'),
+    )
+
+class Submission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    file_path = db.Column(db.String(500), index=True)
+    marks = db.Column(db.Float)
+    feedback = db.Column(db.Text)
+    status = db.Column(db.String(20), default='submitted')
+    submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_submission_assignment_student', 'assignment_id', 'student_id'),
+    )
+
+class LectureMaterial(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    file_path = db.Column(db.String(500), index=True)
+    file_type = db.Column(db.String(50))  # pdf, video, slide, document, link
+    week_number = db.Column(db.Integer)  # Organize by week
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    is_published = db.Column(db.Boolean, default=True)
+
+    __table_args__ = (
+        db.Index('ix_lecture_material_course_teacher', 'course_id', 'teacher_id'),
+    )
+
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50))  # assignment, grade, announcement, material
+    related_id = db.Column(db.Integer)  # ID of related item (assignment_id, etc.)
+    is_read = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Blob(db.Model):
+    """Uploaded file content, stored once per SHA-256 digest"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Rows whose file_path points here
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    """A chunked lecture-material upload that has not been completed yet"""
+    id = db.Column(db.String(32), primary_key=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    week_number = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ReminderLog(db.Model):
+    """One row per due-date reminder sent, so restarts never send it twice"""
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    offset_minutes = db.Column(db.Integer, nullable=False)  # Minutes before due date
+    recipient_count = db.Column(db.Integer, default=0)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('assignment_id', 'offset_minutes', name='uq_reminder_assignment_offset'),
+    )
+
+class SubmissionSignature(db.Model):
+    """MinHash signature of a submitted file's text, shared by every upload of the same content"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    signature = db.Column(db.LargeBinary)  # None when the file had no extractable text
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SimilarityBucket(db.Model):
+    """One LSH band of a submission's signature; submissions sharing a bucket are compared"""
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False, index=True)
+    band = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_similarity_bucket_lookup', 'assignment_id', 'band', 'bucket'),
+    )
+
+class SimilarSubmissionPair(db.Model):
+    """Two submissions to the same assignment whose text is nearly the same"""
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable=False, index=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False)
+    other_submission_id = db.Column(db.Integer, db.ForeignKey('submission.id'), nullable=False)
+    similarity = db.Column(db.Float, nullable=False)  # Estimated Jaccard similarity, 0-1
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('submission_id', 'other_submission_id', name='uq_similar_submission_pair'),
+    )
+
+class Announcement(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=True)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Each course's timeline is read newest first, a range of this index
+        db.Index('ix_announcement_course_created', 'course_id', 'created_at', 'id'),
+    )
+
+class TechIssue(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    issue_description = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='open')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChangeLog(db.Model):
+    """One insert, update or delete of a row that clients sync (see changelog.py).
+
+    Rows are numbered in commit order, so a client's place in the feed is
+    the last id it has seen. course_id and user_id say whose feed the
+    change belongs in.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # API collection: assignments, materials, ...
+    row_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # upsert or delete
+    course_id = db.Column(db.Integer)
+    user_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_course', 'course_id', 'id'),
+        db.Index('ix_change_log_user', 'user_id', 'id'),
+        # Never reuse the id of a pruned row
+        {'sqlite_autoincrement': True}
+    )
+
+class Archive(db.Model):
+    """A deleted user or course whose rows were kept in the archived_* tables"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # user, course
+    subject_id = db.Column(db.Integer, nullable=False)  # Id the user or course had
+    label = db.Column(db.String(200))
+    archived_by = db.Column(db.Integer)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def _archive_table(model):
+    """archived_<table>: the model's columns without keys or constraints, plus archive_id"""
+    # file_path is indexed so blob reference counts and reconcile can find archived files
+    columns = [db.Column(column.name, column.type.copy(), index=column.name == 'file_path')
+               for column in model.__table__.columns]
+    return db.Table(f'archived_{model.__tablename__}', db.metadata,
+                    *columns,
+                    db.Column('archive_id', db.Integer, db.ForeignKey('archive.id'), nullable=False, index=True))
+
+# Rows of these models are copied to their archive table before an archived delete
+ARCHIVE_TABLES = {model: _archive_table(model) for model in (
+    User, Course, Enrollment, Assignment, Submission, LectureMaterial, Notification, Announcement, TechIssue
+)}
+
+# Columns holding the path of a stored file. Archived rows keep their
+# files, so their copies count as references too.
+FILE_MODELS = (Assignment, Submission, LectureMaterial)
+FILE_PATH_COLUMNS = [model.__table__.c.file_path for model in FILE_MODELS] + [
+    ARCHIVE_TABLES[model].c.file_path for model in FILE_MODELS
+]
+
+# ==================== REMOVED FORUM MODELS ====================
+
+def create_missing_indexes():
+    """Create indexes declared on the models that an older database is missing"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
\ No newline at end of file
@@ -0,0 +1,229 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from flask import send_file, abort
+from models import LectureMaterial
+from blobstore import blob_sha256, storage_key
+from storage import get_storage
+from config import Config
+import workers
+
+# Derivative kinds: (longest side in pixels, material file types)
+PREVIEW_KINDS = {
+    'preview': (800, {'pdf'}),  # First page of a PDF
+    'thumb': (320, {'image'}),  # Downscaled image
+}
+
+_pending = set()
+_failed = set()  # Not retried until restart, e.g. a corrupt file or no renderer installed
+_pending_lock = threading.Lock()
+
+class PreviewUnavailable(Exception):
+    """Raised when no renderer is installed for a file type"""
+
+def preview_kind(material):
+    """Which derivative a material gets, or None"""
+    if not blob_sha256(material.file_path):
+        return None
+    for kind, (size, file_types) in PREVIEW_KINDS.items():
+        if material.file_type in file_types:
+            return kind
+    return None
+
+def preview_version(material):
+    """Content hash to put in a material's preview URL, or None if it has no preview.
+
+    A new upload gets a new URL, so browsers can cache each one forever.
+    """
+    if preview_kind(material):
+        return blob_sha256(material.file_path)
+    return None
+
+def cache_path(sha256, kind):
+    return os.path.join(Config.PREVIEW_CACHE_FOLDER, sha256[:2], f"{sha256}-{kind}.jpg")
+
+def schedule_preview(material):
+    """Queue derivative generation in the background pool after an upload"""
+    kind = preview_kind(material)
+    if not kind:
+        return None
+
+    sha256 = blob_sha256(material.file_path)
+    if os.path.exists(cache_path(sha256, kind)):
+        return None
+
+    with _pending_lock:
+        if (sha256, kind) in _pending or (sha256, kind) in _failed:
+            return None
+        _pending.add((sha256, kind))
+
+    future = workers.submit(generate_derivative, storage_key(material.file_path), sha256, kind)
+
+    def _done(future):
+        with _pending_lock:
+            _pending.discard((sha256, kind))
+            if future.exception() is not None:
+                _failed.add((sha256, kind))
+
+    future.add_done_callback(_done)
+    return future
+
+def generate_derivative(key, sha256, kind):
+    """Render one derivative into the cache. Runs in a worker process."""
+    output = cache_path(sha256, kind)
+    if os.path.exists(output):
+        return output
+
+    max_size = PREVIEW_KINDS[kind][0]
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    storage = get_storage()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = storage.local_path(key)
+        if source is None:
+            source = os.path.join(tmp_dir, 'source')
+            storage.download_to(key, source)
+
+        tmp_output = os.path.join(tmp_dir, 'derivative.jpg')
+        if kind == 'preview':
+            _render_pdf_page(source, tmp_output, max_size)
+        else:
+            _render_thumbnail(source, tmp_output, max_size)
+        shutil.move(tmp_output, output)
+
+    enforce_cache_size()
+    return output
+
+def _render_thumbnail(source, output, max_size):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise PreviewUnavailable('Image thumbnails need Pillow')
+
+    with Image.open(source) as image:
+        image.thumbnail((max_size, max_size))
+        if image.mode != 'RGB':
+            # JPEG has no alpha channel: flatten onto white
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        image.save(output, 'JPEG', quality=80, optimize=True)
+
+def _render_pdf_page(source, output, max_size):
+    """First page of a PDF, with PyMuPDF if installed or poppler's pdftoppm"""
+    try:
+        import pymupdf
+    except ImportError:
+        pymupdf = None
+
+    if pymupdf is not None:
+        with pymupdf.open(source) as document:
+            page = document[0]
+            zoom = max_size / max(page.rect.width, page.rect.height)
+            page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom)).save(output, jpg_quality=80)
+        return
+
+    if shutil.which('pdftoppm'):
+        subprocess.run(
+            ['pdftoppm', '-jpeg', '-singlefile', '-f', '1', '-l', '1',
+             '-scale-to', str(max_size), source, output[:-len('.jpg')]],
+            check=True,
+            timeout=60,
+            capture_output=True
+        )
+        return
+
+    raise PreviewUnavailable('PDF previews need PyMuPDF or pdftoppm')
+
+def enforce_cache_size():
+    """Evict least recently used derivatives until the cache fits its size cap.
+
+    Serving a derivative bumps its mtime, so mtime order is LRU order.
+    """
+    entries = []
+    total = 0
+    for folder in _scandir(Config.PREVIEW_CACHE_FOLDER):
+        for entry in _scandir(folder.path):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+    if total <= Config.PREVIEW_CACHE_MAX_BYTES:
+        return 0
+
+    evicted = 0
+    for mtime, size, path in sorted(entries):
+        if total <= Config.PREVIEW_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
+
+def _scandir(path):
+    try:
+        return [entry for entry in os.scandir(path) if entry.is_dir() or entry.is_file()]
+    except FileNotFoundError:
+        return []
+
+def build_missing_previews(log=print):
+    """Render every missing preview in the worker pool, e.g. after the
+    cache folder was cleared or for materials uploaded before previews.
+
+    Returns (built, failed).
+    """
+    jobs = {}
+    materials = LectureMaterial.query.filter(
+        LectureMaterial.file_type.in_(['pdf', 'image'])
+    ).yield_per(500)
+    for material in materials:
+        kind = preview_kind(material)
+        if not kind:
+            continue
+        sha256 = blob_sha256(material.file_path)
+        if (sha256, kind) in jobs or os.path.exists(cache_path(sha256, kind)):
+            continue
+        jobs[(sha256, kind)] = workers.submit(generate_derivative, storage_key(material.file_path), sha256, kind)
+
+    built = failed = 0
+    for (sha256, kind), future in jobs.items():
+        try:
+            future.result()
+            built += 1
+        except Exception as e:
+            failed += 1
+            log(f"  {kind} for {sha256} failed: {e}")
+    return built, failed
+
+def send_preview(material):
+    """Serve a material's cached preview, queueing it if it is not ready yet"""
+    kind = preview_kind(material)
+    if not kind:
+        abort(404)
+
+    sha256 = blob_sha256(material.file_path)
+    path = os.path.abspath(cache_path(sha256, kind))
+    if not os.path.exists(path):
+        schedule_preview(material)
+        abort(404)
+
+    # Mark as recently used for the LRU eviction
+    now = time.time()
+    os.utime(path, (now, now))
+
+    # Keyed by content hash, so it can be cached for as long as the browser likes
+    response = send_file(path, mimetype='image/jpeg', etag=f"{sha256}-{kind}", conditional=True)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.no_cache = None
+    response.cache_control.max_age = Config.PREVIEW_MAX_AGE
+    response.cache_control.immutable = True
+    return response
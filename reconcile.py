@@ -0,0 +1,161 @@
+import heapq
+import json
+import os
+import time
+from flask import current_app
+from models import db, FILE_PATH_COLUMNS
+from blobstore import storage_key, blob_sha256, remove_if_unused
+from storage import get_storage
+from config import Config
+
+# Top-level upload folders that are not referenced by file_path columns
+SKIP_FOLDERS = {'tmp', 'profiles'}
+
+def _byte_ordered(column):
+    """column compared byte by byte, as Python and S3 sort keys. PostgreSQL
+    would otherwise use the database's collation, which can order paths
+    differently and break the merge-join."""
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return column.collate('C')
+    return column
+
+def _referenced_keys(column, after, batch_size=1000):
+    """Storage keys referenced by one table, streamed in sorted order.
+
+    Read a page at a time by keyset, so no cursor stays open while
+    orphans are deleted and committed.
+    """
+    table = column.table.name
+    ordered = _byte_ordered(column)
+    while True:
+        query = db.session.query(column).filter(
+            column.isnot(None),
+            ~column.like('%://%')
+        )
+        if after:
+            query = query.filter(ordered > after)
+        paths = [file_path for (file_path,) in query.order_by(ordered).limit(batch_size)]
+
+        for file_path in paths:
+            yield storage_key(file_path), table
+        if len(paths) < batch_size:
+            return
+        after = paths[-1]
+
+def referenced_keys(after=None):
+    """Merge the sorted file_path streams of every referencing table,
+    archived ones included"""
+    streams = [_referenced_keys(column, after) for column in FILE_PATH_COLUMNS]
+    last = None
+    for key, table in heapq.merge(*streams, key=lambda item: item[0]):
+        if key != last:
+            last = key
+            yield key, table
+
+def is_still_referenced(key):
+    """Re-check one key just before deleting it, in case a row appeared meanwhile.
+
+    Blob rows store key + '.ext', so this is a range scan on the index.
+    """
+    for column in FILE_PATH_COLUMNS:
+        ordered = _byte_ordered(column)
+        exists = db.session.query(column).filter(
+            ordered >= key,
+            ordered < key + '/'
+        ).first()
+        if exists:
+            return True
+    return False
+
+def checkpoint_path():
+    return os.path.join(current_app.instance_path, 'reconcile_checkpoint.json')
+
+def load_checkpoint():
+    try:
+        with open(checkpoint_path()) as f:
+            return json.load(f).get('after')
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_checkpoint(after):
+    os.makedirs(os.path.dirname(checkpoint_path()), exist_ok=True)
+    with open(checkpoint_path(), 'w') as f:
+        json.dump({'after': after, 'saved_at': time.time()}, f)
+
+def reconcile_uploads(delete=False, limit=None, resume=True, log=print):
+    """Compare stored files with the file_path columns using a merge-join.
+
+    Both sides are streamed in sorted order (the storage backend lists
+    keys sorted, as S3 does), so memory stays constant no
+    matter how many files there are. Reports orphans (files nothing
+    references) and dangling references (rows whose file is missing).
+    With delete=True orphans older than the grace period are removed,
+    including blobs whose reference count has dropped to zero.
+    With a limit, stops after that many files and saves a checkpoint so
+    the next run carries on from there.
+
+    Returns a dict of totals.
+    """
+    after = load_checkpoint() if resume else None
+    grace_cutoff = time.time() - Config.RECONCILE_GRACE_MINUTES * 60
+    totals = {'files': 0, 'orphans': 0, 'dangling': 0, 'bytes_orphaned': 0, 'bytes_reclaimed': 0}
+
+    storage = get_storage()
+    disk = storage.iter_files(skip_folders=SKIP_FOLDERS, start_after=after)
+    refs = (item for item in referenced_keys(after) if not after or item[0] > after)
+
+    ref = next(refs, None)
+    last_path = None
+    for path, size, mtime in disk:
+        if limit and totals['files'] >= limit:
+            break
+        totals['files'] += 1
+        last_path = path
+
+        # References sorting before this file have no file on disk
+        while ref is not None and ref[0] < path:
+            _report_dangling(ref, totals, log)
+            ref = next(refs, None)
+
+        if ref is not None and ref[0] == path:
+            ref = next(refs, None)
+            continue
+
+        totals['orphans'] += 1
+        totals['bytes_orphaned'] += size
+        if not delete:
+            log(f"  orphan: {path} ({size} bytes)")
+            continue
+        if mtime > grace_cutoff or is_still_referenced(path):
+            log(f"  skipped (recent or just referenced): {path}")
+            continue
+        if not _delete_orphan(storage, path, size):
+            log(f"  skipped (just referenced): {path}")
+            continue
+        totals['bytes_reclaimed'] += size
+        log(f"  deleted: {path} ({size} bytes)")
+    else:
+        # The whole tree was read: everything left on the reference side is dangling
+        while ref is not None:
+            _report_dangling(ref, totals, log)
+            ref = next(refs, None)
+        last_path = None
+
+    save_checkpoint(last_path)
+    totals['complete'] = last_path is None
+    return totals
+
+def _report_dangling(ref, totals, log):
+    totals['dangling'] += 1
+    log(f"  dangling: {ref[0]} (referenced from {ref[1]})")
+
+def _delete_orphan(storage, path, size):
+    """Delete an orphaned file, unless an upload has just taken a reference
+    to its blob. Each file is its own short transaction."""
+    sha256 = blob_sha256(path)
+    if sha256 and not remove_if_unused(sha256, size):
+        db.session.rollback()
+        return False
+    storage.delete(path)
+    db.session.commit()
+    return True
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from cache import content_version, invalidate_on_commit, on_invalidate, version_key
+from config import Config
+from models import db, User, Course
+
+CourseRef = namedtuple('CourseRef', 'id name description')
+
+# Committing a change to the table drops the shared version stamp of its
+# kind, so every worker reloads its copies
+invalidate_on_commit(version_key('courses'), Course)
+invalidate_on_commit(version_key('users'), User)
+
+class ReferenceCache:
+    """Slow-changing rows kept in this process's memory.
+
+    Entries are stamped with the shared version of their kind when loaded
+    and ignored once that version moves on. The shared version is read at
+    most every REFERENCE_CACHE_CHECK_SECONDS, and right away after this
+    process commits a change. Past max_entries the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (kind, key) -> (version, value)
+        self._versions = {}  # kind -> (version, when it was read)
+        self._lock = threading.Lock()
+
+    def version(self, kind):
+        now = time.monotonic()
+        known = self._versions.get(kind)
+        if known and now - known[1] < Config.REFERENCE_CACHE_CHECK_SECONDS:
+            return known[0]
+        version = content_version(kind)
+        self._versions[kind] = (version, now)
+        return version
+
+    def forget_versions(self):
+        self._versions.clear()
+
+    def get(self, kind, key, load):
+        """The cached value for key, or load() stored under the current version"""
+        return self.get_many(kind, [key], lambda keys: {key: load()})[key]
+
+    def get_many(self, kind, keys, load_many):
+        """{key: value}, calling load_many(missing keys) -> {key: value} once for the misses"""
+        version = self.version(kind)
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((kind, key))
+                if entry is not None and entry[0] == version:
+                    self._entries.move_to_end((kind, key))
+                    found[key] = entry[1]
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            loaded = load_many(missing)
+            with self._lock:
+                for key in missing:
+                    found[key] = loaded.get(key)
+                    self._entries[(kind, key)] = (version, found[key])
+                    self._entries.move_to_end((kind, key))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return found
+
+_cache = ReferenceCache(Config.REFERENCE_CACHE_SIZE)
+
+@on_invalidate
+def _check_versions_again(keys):
+    if {version_key('courses'), version_key('users')} & set(keys):
+        _cache.forget_versions()
+
+def _load_courses():
+    rows = db.session.query(Course.id, Course.name, Course.description).order_by(Course.name, Course.id)
+    return [CourseRef(*row) for row in rows]
+
+def all_courses():
+    """Every course as a CourseRef (id, name, description), ordered by name"""
+    return _cache.get('courses', 'all', _load_courses)
+
+def get_course(course_id):
+    """The CourseRef for an id, or None"""
+    by_id = _cache.get('courses', 'by_id', lambda: {course.id: course for course in all_courses()})
+    return by_id.get(int(course_id)) if course_id is not None else None
+
+def course_name(course_id):
+    course = get_course(course_id)
+    return course.name if course else None
+
+def user_names(user_ids):
+    """{user_id: display name} for many users, loading the uncached ones in one query"""
+    def load(ids):
+        return dict(db.session.query(User.id, User.name).filter(User.id.in_(ids)))
+    return _cache.get_many('users', [int(user_id) for user_id in set(user_ids)], load)
+
+def user_name(user_id):
+    if user_id is None:
+        return None
+    return user_names([user_id])[int(user_id)]
+
+def register_template_helpers(app):
+    """Make course_name() and user_name() available in every template"""
+    app.jinja_env.globals.update(course_name=course_name, user_name=user_name)
@@ -0,0 +1,176 @@
+import heapq
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from models import db, Assignment, Enrollment, Submission, ReminderLog
+from notifications import create_bulk_notifications
+from config import Config
+
+def pending_student_ids(assignment):
+    """Active students in the assignment's course who have not submitted yet.
+
+    A single anti-join: enrollments LEFT JOIN submissions, keeping the rows
+    with no matching submission.
+    """
+    rows = db.session.query(Enrollment.user_id).outerjoin(
+        Submission,
+        and_(
+            Submission.assignment_id == assignment.id,
+            Submission.student_id == Enrollment.user_id
+        )
+    ).filter(
+        Enrollment.course_id == assignment.course_id,
+        Enrollment.status == 'active',
+        Submission.id.is_(None)
+    ).distinct().all()
+
+    return [row.user_id for row in rows]
+
+class ReminderScheduler:
+    """Sends batched due-date reminders at fixed offsets before each deadline.
+
+    Upcoming reminders live in a heap ordered by the time they should fire.
+    The heap is filled from a range query on the indexed due_date column,
+    one slice of the timeline at a time, so a tick never scans the whole
+    assignment table. ReminderLog rows make sending idempotent across
+    restarts and between several scheduler processes.
+    """
+
+    def __init__(self, offsets_hours=None, horizon_hours=None):
+        offsets_hours = offsets_hours or Config.REMINDER_OFFSETS_HOURS
+        self.offsets = sorted(int(hours * 60) for hours in offsets_hours)
+        self.horizon = timedelta(hours=horizon_hours or Config.REMINDER_HORIZON_HOURS)
+        self.heap = []
+        self.queued = set()
+        self.loaded_until = None  # Deadlines up to this time are already queued
+        self.last_assignment_id = 0  # Newest assignment seen by a refill
+
+    def refill(self, now=None):
+        """Queue reminders for deadlines that entered the loading window"""
+        now = now or datetime.utcnow()
+        window_end = now + timedelta(minutes=self.offsets[-1]) + self.horizon
+
+        # Only the slice of the timeline not loaded before
+        window_start = self.loaded_until if self.loaded_until and self.loaded_until > now else now
+        query = Assignment.query.with_entities(Assignment.id, Assignment.due_date).filter(
+            Assignment.due_date > window_start,
+            Assignment.due_date <= window_end
+        )
+        assignments = query.all()
+
+        # Assignments created since the last refill with a deadline inside
+        # the slice that was already loaded
+        if self.loaded_until and self.loaded_until > now:
+            assignments += Assignment.query.with_entities(Assignment.id, Assignment.due_date).filter(
+                Assignment.id > self.last_assignment_id,
+                Assignment.due_date > now,
+                Assignment.due_date <= self.loaded_until
+            ).all()
+
+        self.loaded_until = window_end
+        if not assignments:
+            return 0
+
+        self.last_assignment_id = max(
+            self.last_assignment_id,
+            max(assignment.id for assignment in assignments)
+        )
+
+        # Reminders already sent for this batch, fetched in one query
+        assignment_ids = [assignment.id for assignment in assignments]
+        sent = {
+            (log.assignment_id, log.offset_minutes)
+            for log in ReminderLog.query.with_entities(
+                ReminderLog.assignment_id, ReminderLog.offset_minutes
+            ).filter(ReminderLog.assignment_id.in_(assignment_ids)).all()
+        }
+
+        queued = 0
+        for assignment in assignments:
+            for offset in self._offsets_to_queue(assignment.due_date, now):
+                key = (assignment.id, offset)
+                if key in sent or key in self.queued:
+                    continue
+                fire_at = assignment.due_date - timedelta(minutes=offset)
+                heapq.heappush(self.heap, (fire_at, assignment.id, offset))
+                self.queued.add(key)
+                queued += 1
+
+        return queued
+
+    def _offsets_to_queue(self, due_date, now):
+        """Future offsets, plus the most recent one that has already passed.
+
+        Offsets passed while the scheduler was down are caught up, but only
+        the latest one, so a student never gets two reminders at once.
+        """
+        future = [o for o in self.offsets if due_date - timedelta(minutes=o) > now]
+        passed = [o for o in self.offsets if o not in future]
+        if passed:
+            future.append(min(passed))
+        return future
+
+    def tick(self, now=None):
+        """Refill the heap and send every reminder that is due. Returns the number sent."""
+        now = now or datetime.utcnow()
+        self.refill(now)
+
+        sent = 0
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, assignment_id, offset = heapq.heappop(self.heap)
+            self.queued.discard((assignment_id, offset))
+            if send_reminder(assignment_id, offset, now):
+                sent += 1
+        return sent
+
+    def seconds_until_next(self, now=None):
+        """Seconds until the earliest queued reminder, or None when the heap is empty"""
+        if not self.heap:
+            return None
+        now = now or datetime.utcnow()
+        return max(0, (self.heap[0][0] - now).total_seconds())
+
+    def run(self, poll_seconds=None):
+        """Run the scheduler until interrupted"""
+        poll_seconds = poll_seconds or Config.REMINDER_POLL_SECONDS
+        while True:
+            self.tick()
+            # Sessions must not hold a transaction open while sleeping
+            db.session.remove()
+            wait = self.seconds_until_next()
+            time.sleep(poll_seconds if wait is None else min(wait, poll_seconds))
+
+def send_reminder(assignment_id, offset_minutes, now=None):
+    """Send one batched reminder for an assignment. Returns True if it was sent."""
+    now = now or datetime.utcnow()
+    assignment = Assignment.query.get(assignment_id)
+    if not assignment or assignment.due_date <= now:
+        return False
+
+    # Claim the reminder first: the unique constraint stops a restarted or
+    # second scheduler from sending it again
+    log = ReminderLog(assignment_id=assignment_id, offset_minutes=offset_minutes, sent_at=now)
+    db.session.add(log)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+    student_ids = pending_student_ids(assignment)
+    log.recipient_count = len(student_ids)
+
+    if not student_ids:
+        db.session.commit()
+        return True
+
+    # The log row and the notifications are committed together
+    create_bulk_notifications(
+        user_ids=student_ids,
+        title="Assignment Due Soon",
+        message=f"Reminder: '{assignment.title}' for {assignment.course.name} is due on {assignment.due_date.strftime('%b %d, %Y %H:%M')}",
+        notification_type="reminder",
+        related_id=assignment.id
+    )
+    return True
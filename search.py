@@ -0,0 +1,422 @@
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from functools import partial
+from xml.etree import ElementTree
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+from models import db, User, Course, Enrollment, Assignment, LectureMaterial
+from blobstore import storage_key
+from storage import get_storage
+import workers
+
+# Extracted text is capped so one huge file cannot bloat the index
+MAX_EXTRACTED_CHARS = 200 * 1024
+EXTRACTABLE_EXTENSIONS = {'txt', 'pdf', 'docx'}
+RESULTS_LIMIT = 50
+USER_RESULTS_LIMIT = 10
+
+# Each document gets a fixed row id, so updates and deletes hit the key
+DOC_TYPES = {'material': 0, 'assignment': 1}
+
+# Snippet highlight markers, swapped for <mark> after escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+def _backend():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return 'fts5'
+    if dialect == 'postgresql':
+        return 'tsvector'
+    return None
+
+def _row_id(doc_type, doc_id):
+    return doc_id * len(DOC_TYPES) + DOC_TYPES[doc_type]
+
+def create_search_index():
+    """Create the search table for the current database if it is missing"""
+    backend = _backend()
+    if backend == 'fts5':
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "title, description, content, "
+            "doc_type UNINDEXED, doc_id UNINDEXED, course_id UNINDEXED, published UNINDEXED, "
+            "tokenize = 'porter unicode61 remove_diacritics 2')"
+        ))
+    elif backend == 'tsvector':
+        db.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS search_index ("
+            "id BIGINT PRIMARY KEY, doc_type VARCHAR(20) NOT NULL, doc_id INTEGER NOT NULL, "
+            "course_id INTEGER NOT NULL, published BOOLEAN NOT NULL, "
+            "title TEXT, description TEXT, content TEXT, document TSVECTOR)"
+        ))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_search_index_document ON search_index USING GIN (document)"
+        ))
+    create_user_search_index()
+    db.session.commit()
+
+# Keeping the index up to date
+
+def _document_fields(doc):
+    if isinstance(doc, LectureMaterial):
+        return 'material', bool(doc.is_published)
+    return 'assignment', True
+
+def index_document(doc, extract=True):
+    """Add or refresh a material or assignment in the index.
+
+    Title and description are written now, in the caller's transaction.
+    Text from an attached pdf/txt/docx file is extracted in the background
+    worker pool and filled in when it is ready.
+    """
+    backend = _backend()
+    if backend is None:
+        return
+
+    doc_type, published = _document_fields(doc)
+    params = {
+        'id': _row_id(doc_type, doc.id),
+        'doc_type': doc_type,
+        'doc_id': doc.id,
+        'course_id': doc.course_id,
+        'published': published,
+        'title': doc.title or '',
+        'description': doc.description or ''
+    }
+
+    if backend == 'fts5':
+        db.session.execute(text("DELETE FROM search_index WHERE rowid = :id"), params)
+        db.session.execute(text(
+            "INSERT INTO search_index (rowid, title, description, content, doc_type, doc_id, course_id, published) "
+            "VALUES (:id, :title, :description, '', :doc_type, :doc_id, :course_id, :published)"
+        ), params)
+    else:
+        db.session.execute(text(
+            "INSERT INTO search_index (id, doc_type, doc_id, course_id, published, title, description, content, document) "
+            "VALUES (:id, :doc_type, :doc_id, :course_id, :published, :title, :description, '', "
+            "setweight(to_tsvector('english', :title), 'A') || setweight(to_tsvector('english', :description), 'B')) "
+            "ON CONFLICT (id) DO UPDATE SET course_id = EXCLUDED.course_id, published = EXCLUDED.published, "
+            "title = EXCLUDED.title, description = EXCLUDED.description, content = '', document = EXCLUDED.document"
+        ), params)
+
+    if extract:
+        schedule_extraction(doc_type, doc)
+
+def remove_document(doc):
+    """Drop a material or assignment from the index, in the caller's transaction"""
+    if _backend() is None:
+        return
+    doc_type = _document_fields(doc)[0]
+    key_column = 'rowid' if _backend() == 'fts5' else 'id'
+    db.session.execute(text(f"DELETE FROM search_index WHERE {key_column} = :id"),
+                       {'id': _row_id(doc_type, doc.id)})
+
+def remove_documents(doc_type, doc_ids):
+    """remove_document() for many materials or assignments in one statement"""
+    if _backend() is None or not doc_ids:
+        return
+    key_column = 'rowid' if _backend() == 'fts5' else 'id'
+    db.session.execute(
+        text(f"DELETE FROM search_index WHERE {key_column} IN :ids").bindparams(bindparam('ids', expanding=True)),
+        {'ids': [_row_id(doc_type, doc_id) for doc_id in doc_ids]}
+    )
+
+def _extension(file_path):
+    return file_path.rsplit('.', 1)[-1].lower() if file_path and '.' in file_path else ''
+
+def _extraction_job(doc_type, doc):
+    """(row id, storage key, extension) for a document whose file has text to extract"""
+    file_path = doc.file_path
+    extension = _extension(file_path)
+    if not file_path or '://' in file_path or extension not in EXTRACTABLE_EXTENSIONS:
+        return None
+    return _row_id(doc_type, doc.id), storage_key(file_path), extension
+
+def schedule_extraction(doc_type, doc):
+    """Extract the text of a document's file once the index row is committed"""
+    job = _extraction_job(doc_type, doc)
+    if job:
+        db.session.info.setdefault('pending_extractions', []).append(job)
+
+@event.listens_for(Session, 'after_commit')
+def _start_extractions(session):
+    jobs = session.info.pop('pending_extractions', [])
+    if not jobs:
+        return
+    app = current_app._get_current_object()
+    for row_id, key, extension in jobs:
+        future = workers.submit(extract_text, key, extension)
+        future.add_done_callback(partial(_save_extraction, app, row_id))
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_extractions(session):
+    session.info.pop('pending_extractions', None)
+
+def _save_extraction(app, row_id, future):
+    # Runs on the pool's result thread once a worker finishes
+    if future.exception() is not None:
+        return
+    with app.app_context():
+        save_extracted_text(row_id, future.result())
+
+def save_extracted_text(row_id, content):
+    """Store extracted text for an indexed document. A document deleted
+    while its text was being extracted is left deleted."""
+    if not content:
+        return
+    if _backend() == 'fts5':
+        db.session.execute(text("UPDATE search_index SET content = :content WHERE rowid = :id"),
+                           {'id': row_id, 'content': content})
+    else:
+        db.session.execute(text(
+            "UPDATE search_index SET content = :content, "
+            "document = setweight(to_tsvector('english', title), 'A') || "
+            "setweight(to_tsvector('english', description), 'B') || "
+            "setweight(to_tsvector('english', :content), 'C') "
+            "WHERE id = :id"
+        ), {'id': row_id, 'content': content})
+    db.session.commit()
+
+def rebuild_search_index(log=print):
+    """Re-index every material and assignment, waiting for all extractions.
+
+    Returns the number of documents indexed.
+    """
+    create_search_index()
+    db.session.execute(text("DELETE FROM search_index"))
+
+    futures = []
+    count = 0
+    for doc_type, model in (('material', LectureMaterial), ('assignment', Assignment)):
+        for doc in model.query.yield_per(500):
+            index_document(doc, extract=False)
+            count += 1
+            job = _extraction_job(doc_type, doc)
+            if job:
+                futures.append((job, workers.submit(extract_text, job[1], job[2])))
+    db.session.commit()
+
+    for (row_id, key, extension), future in futures:
+        try:
+            save_extracted_text(row_id, future.result())
+        except Exception as e:
+            log(f"  could not extract text from {key}: {e}")
+    return count
+
+# Text extraction (runs in worker processes)
+
+def extract_text(key, extension):
+    """Plain text of a stored pdf, txt or docx file"""
+    storage = get_storage()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = storage.local_path(key)
+        if source is None:
+            source = f"{tmp_dir}/source.{extension}"
+            storage.download_to(key, source)
+
+        if extension == 'txt':
+            with open(source, 'rb') as f:
+                content = f.read(MAX_EXTRACTED_CHARS * 4).decode('utf-8', errors='replace')
+        elif extension == 'pdf':
+            content = _pdf_text(source)
+        else:
+            content = _docx_text(source)
+
+    return content[:MAX_EXTRACTED_CHARS]
+
+def _pdf_text(source):
+    """PDF text with PyMuPDF if installed, else poppler's pdftotext"""
+    try:
+        import pymupdf
+    except ImportError:
+        pymupdf = None
+
+    if pymupdf is not None:
+        parts = []
+        length = 0
+        with pymupdf.open(source) as document:
+            for page in document:
+                parts.append(page.get_text())
+                length += len(parts[-1])
+                if length >= MAX_EXTRACTED_CHARS:
+                    break
+        return '\n'.join(parts)
+
+    if shutil.which('pdftotext'):
+        result = subprocess.run(['pdftotext', '-enc', 'UTF-8', source, '-'],
+                                capture_output=True, timeout=120, check=True)
+        return result.stdout.decode('utf-8', errors='replace')
+
+    return ''
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+def _docx_text(source):
+    """Paragraph text of a .docx, read straight from its XML"""
+    paragraphs = []
+    with zipfile.ZipFile(source) as archive:
+        with archive.open('word/document.xml') as xml:
+            for event, element in ElementTree.iterparse(xml):
+                if element.tag == WORD_NAMESPACE + 'p':
+                    paragraphs.append(''.join(node.text or '' for node in element.iter(WORD_NAMESPACE + 't')))
+                    element.clear()
+    return '\n'.join(paragraphs)
+
+# Querying
+
+def _fts5_query(query):
+    """Turn free text into an FTS5 query: every word must match, the last as a prefix"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_for_student(student_id, query, limit=RESULTS_LIMIT):
+    """Published materials and assignments of the student's active courses
+    matching the query, best matches first"""
+    backend = _backend()
+    params = {'student_id': student_id, 'limit': limit}
+
+    if backend == 'fts5':
+        params['query'] = _fts5_query(query)
+        if not params['query']:
+            return []
+        sql = (
+            "SELECT doc_type, doc_id, course_id, title, "
+            f"snippet(search_index, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS snippet "
+            "FROM search_index "
+            "WHERE search_index MATCH :query AND published = 1 AND course_id IN ("
+            "SELECT course_id FROM enrollment WHERE user_id = :student_id AND status = 'active') "
+            "ORDER BY bm25(search_index, 10.0, 4.0, 1.0) LIMIT :limit"
+        )
+    elif backend == 'tsvector':
+        params['query'] = query
+        sql = (
+            "SELECT doc_type, doc_id, course_id, title, "
+            f"ts_headline('english', coalesce(nullif(content, ''), description), query, "
+            f"'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=30, MinWords=10') AS snippet "
+            "FROM (SELECT *, ts_rank(document, query) AS rank "
+            "FROM search_index, websearch_to_tsquery('english', :query) AS query "
+            "WHERE document @@ query AND published AND course_id IN ("
+            "SELECT course_id FROM enrollment WHERE user_id = :student_id AND status = 'active') "
+            "ORDER BY rank DESC LIMIT :limit) AS matches "
+            "ORDER BY rank DESC"
+        )
+    else:
+        return _search_without_index(student_id, query, limit)
+
+    rows = db.session.execute(text(sql), params).fetchall()
+    return _results(rows)
+
+def _search_without_index(student_id, query, limit):
+    """Title/description LIKE search for databases without full-text support"""
+    course_ids = db.session.query(Enrollment.course_id).filter_by(user_id=student_id, status='active')
+    pattern = f"%{query}%"
+    rows = []
+    for doc_type, model in (('material', LectureMaterial), ('assignment', Assignment)):
+        matches = model.query.filter(
+            model.course_id.in_(course_ids),
+            db.or_(model.title.ilike(pattern), model.description.ilike(pattern))
+        )
+        if model is LectureMaterial:
+            matches = matches.filter(LectureMaterial.is_published == True)
+        rows.extend((doc_type, doc.id, doc.course_id, doc.title, doc.description or '')
+                    for doc in matches.limit(limit))
+    return _results(rows[:limit])
+
+def _results(rows):
+    course_names = dict(db.session.query(Course.id, Course.name).filter(
+        Course.id.in_({row[2] for row in rows})
+    ).all()) if rows else {}
+
+    return [{
+        'type': doc_type,
+        'id': doc_id,
+        'course_id': course_id,
+        'course_name': course_names.get(course_id, ''),
+        'title': title,
+        'snippet': _highlight(snippet)
+    } for doc_type, doc_id, course_id, title, snippet in rows]
+
+def _highlight(snippet):
+    """Escape a snippet and turn the highlight markers into <mark> tags"""
+    return escape(snippet or '').replace(HIGHLIGHT_START, Markup('<mark>')).replace(HIGHLIGHT_END, Markup('</mark>'))
+
+# User directory
+
+def create_user_search_index():
+    """Index user names, usernames and student numbers.
+
+    SQLite gets an FTS5 table over the user table with prefix indexes,
+    kept in sync by triggers so bulk inserts and raw updates are covered
+    too. PostgreSQL gets trigram indexes that serve ILIKE '%...%'.
+    """
+    backend = _backend()
+    if backend == 'fts5':
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_search'"
+        )).first()
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5("
+            "name, username, student_number, content = 'user', content_rowid = 'id', "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+        ))
+        columns = "name, username, student_number"
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS user_search_insert AFTER INSERT ON user BEGIN "
+            f"INSERT INTO user_search (rowid, {columns}) VALUES (new.id, new.name, new.username, new.student_number); END"
+        ))
+        db.session.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS user_search_delete AFTER DELETE ON user BEGIN "
+            f"INSERT INTO user_search (user_search, rowid, {columns}) "
+            "VALUES ('delete', old.id, old.name, old.username, old.student_number); END"
+        ))
+        db.session.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS user_search_update AFTER UPDATE OF {columns} ON user BEGIN "
+            f"INSERT INTO user_search (user_search, rowid, {columns}) "
+            "VALUES ('delete', old.id, old.name, old.username, old.student_number); "
+            f"INSERT INTO user_search (rowid, {columns}) VALUES (new.id, new.name, new.username, new.student_number); END"
+        ))
+        if not exists:
+            # Index the users that were there before the table
+            db.session.execute(text("INSERT INTO user_search (user_search) VALUES ('rebuild')"))
+    elif backend == 'tsvector':
+        db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in ('name', 'username', 'student_number'):
+            db.session.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_user_{column}_trgm ON "user" USING GIN ({column} gin_trgm_ops)'
+            ))
+
+def user_search_clause(query):
+    """Filter for users whose name, username or student number match the query.
+
+    With FTS5 every word must start a word of one of those fields; other
+    databases look for the query anywhere in them.
+    """
+    if _backend() == 'fts5':
+        match = _fts5_query(query)
+        if not match:
+            return db.false()
+        return User.id.in_(
+            text("SELECT rowid FROM user_search WHERE user_search MATCH :user_query")
+            .bindparams(user_query=match).columns(rowid=db.Integer)
+        )
+    pattern = f"%{query.strip()}%"
+    return db.or_(User.name.ilike(pattern), User.username.ilike(pattern), User.student_number.ilike(pattern))
+
+def search_users(query, role=None, limit=USER_RESULTS_LIMIT):
+    """Typeahead lookup: (id, name, username, student_number, role) of matching users by name"""
+    matches = db.session.query(User.id, User.name, User.username, User.student_number, User.role).filter(
+        user_search_clause(query)
+    )
+    if role:
+        matches = matches.filter(User.role == role)
+    return matches.order_by(User.name, User.id).limit(limit).all()
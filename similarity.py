@@ -0,0 +1,207 @@
+import hashlib
+import random
+import re
+import struct
+from flask import current_app
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import db, Submission, SubmissionSignature, SimilarityBucket, SimilarSubmissionPair
+from blobstore import blob_sha256, storage_key
+from search import extract_text, EXTRACTABLE_EXTENSIONS
+from config import Config
+import workers
+
+NUM_PERM = 128
+# 16 bands of 8 rows make pairs around 70% similar likely to share a
+# bucket, matching the default SIMILARITY_THRESHOLD
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures must stay comparable across processes and restarts
+_rng = random.Random(35)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE_FORMAT = f'<{NUM_PERM}I'
+
+# Signatures (runs in worker processes)
+
+def shingles(content):
+    """Overlapping runs of SHINGLE_WORDS words, ignoring case and punctuation"""
+    words = re.findall(r'\w+', content.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash(shingle_set):
+    """Packed MinHash signature of a set of shingles"""
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+              for shingle in shingle_set]
+    signature = [min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH for a, b in _PERMUTATIONS]
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+def compute_signature(key, extension):
+    """Signature of a stored file's text, or None if it has none"""
+    shingle_set = shingles(extract_text(key, extension))
+    if not shingle_set:
+        return None
+    return minhash(shingle_set)
+
+# Comparing
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity: the share of matching MinHash values"""
+    matches = sum(1 for x, y in zip(struct.unpack(_SIGNATURE_FORMAT, signature),
+                                    struct.unpack(_SIGNATURE_FORMAT, other)) if x == y)
+    return matches / NUM_PERM
+
+def band_buckets(signature):
+    """One bucket key per band, as a signed 64-bit integer"""
+    width = ROWS * 4
+    return [int.from_bytes(hashlib.blake2b(signature[band * width:(band + 1) * width], digest_size=8).digest(),
+                           'little', signed=True)
+            for band in range(BANDS)]
+
+def _signature_job(submission):
+    """(sha256, storage key, extension) for a submission whose text can be compared"""
+    sha256 = blob_sha256(submission.file_path)
+    extension = submission.file_path.rsplit('.', 1)[-1].lower() if submission.file_path else ''
+    if not sha256 or extension not in EXTRACTABLE_EXTENSIONS:
+        return None
+    return sha256, storage_key(submission.file_path), extension
+
+def index_submission(submission, signature):
+    """Put a submission in its assignment's LSH buckets and flag near-duplicates.
+
+    Only submissions sharing at least one bucket are compared, so this is
+    one indexed probe plus a handful of comparisons rather than a pass
+    over every other submission. The caller commits.
+    """
+    if signature is None:
+        return 0
+    if SimilarityBucket.query.filter_by(submission_id=submission.id).first():
+        return 0
+
+    buckets = band_buckets(signature)
+    candidate_ids = [row[0] for row in db.session.query(SimilarityBucket.submission_id).filter(
+        SimilarityBucket.assignment_id == submission.assignment_id,
+        tuple_(SimilarityBucket.band, SimilarityBucket.bucket).in_(list(enumerate(buckets)))
+    ).distinct()]
+
+    flagged = 0
+    if candidate_ids:
+        candidates = Submission.query.filter(Submission.id.in_(candidate_ids)).all()
+        shas = {candidate.id: blob_sha256(candidate.file_path) for candidate in candidates}
+        signatures = dict(db.session.query(SubmissionSignature.sha256, SubmissionSignature.signature).filter(
+            SubmissionSignature.sha256.in_(set(shas.values()))
+        ).all())
+
+        for candidate_id, sha256 in shas.items():
+            other = signatures.get(sha256)
+            if other is None:
+                continue
+            similarity = estimate_similarity(signature, other)
+            if similarity >= Config.SIMILARITY_THRESHOLD:
+                db.session.add(SimilarSubmissionPair(
+                    assignment_id=submission.assignment_id,
+                    submission_id=min(candidate_id, submission.id),
+                    other_submission_id=max(candidate_id, submission.id),
+                    similarity=similarity
+                ))
+                flagged += 1
+
+    db.session.execute(insert(SimilarityBucket), [{
+        'assignment_id': submission.assignment_id,
+        'submission_id': submission.id,
+        'band': band,
+        'bucket': bucket
+    } for band, bucket in enumerate(buckets)])
+    return flagged
+
+def _store_signature(sha256, signature):
+    """Cache a file's signature and commit. Two uploads of the same file
+    may be signed at once; the second insert is dropped, since the first
+    stored the same signature."""
+    if SubmissionSignature.query.get(sha256):
+        return
+    db.session.add(SubmissionSignature(sha256=sha256, signature=signature))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+def schedule_similarity_check(submission):
+    """Compare a newly committed submission with the others for its assignment.
+
+    A file seen before reuses its cached signature; otherwise the text is
+    extracted and signed in the background worker pool.
+    """
+    job = _signature_job(submission)
+    if not job:
+        return None
+
+    sha256, key, extension = job
+    cached = SubmissionSignature.query.get(sha256)
+    if cached:
+        index_submission(submission, cached.signature)
+        db.session.commit()
+        return None
+
+    app = current_app._get_current_object()
+    submission_id = submission.id
+    future = workers.submit(compute_signature, key, extension)
+
+    def _done(future):
+        # Runs on the pool's result thread once a worker finishes. Anything
+        # raised here would be dropped silently, so failures are logged.
+        if future.exception() is not None:
+            app.logger.error('Could not sign submission %s: %s', submission_id, future.exception())
+            return
+        with app.app_context():
+            try:
+                _store_signature(sha256, future.result())
+                submission = Submission.query.get(submission_id)
+                if submission:
+                    index_submission(submission, future.result())
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Could not index submission %s for similarity', submission_id)
+
+    future.add_done_callback(_done)
+    return future
+
+def index_all_submissions(log=print):
+    """Sign and index every submission that is not in the buckets yet.
+
+    Returns (indexed, flagged).
+    """
+    indexed_ids = {row[0] for row in db.session.query(SimilarityBucket.submission_id).distinct()}
+    pending = [submission for submission in Submission.query.order_by(Submission.id)
+               if submission.id not in indexed_ids and _signature_job(submission)]
+
+    # One signature per distinct file content
+    known = {row[0] for row in db.session.query(SubmissionSignature.sha256)}
+    futures = {}
+    for submission in pending:
+        sha256, key, extension = _signature_job(submission)
+        if sha256 not in known and sha256 not in futures:
+            futures[sha256] = workers.submit(compute_signature, key, extension)
+
+    for sha256, future in futures.items():
+        try:
+            _store_signature(sha256, future.result())
+        except Exception as e:
+            log(f"  could not sign {sha256}: {e}")
+    db.session.commit()
+
+    indexed = flagged = 0
+    for submission in pending:
+        cached = SubmissionSignature.query.get(blob_sha256(submission.file_path))
+        if cached:
+            flagged += index_submission(submission, cached.signature)
+            db.session.flush()
+            indexed += 1
+    db.session.commit()
+    return indexed, flagged
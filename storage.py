@@ -0,0 +1,288 @@
+import os
+import shutil
+import uuid
+from config import Config
+
+class StorageError(Exception):
+    """Raised when a storage backend is misconfigured or unavailable"""
+
+class LocalStorage:
+    """Stores files under a folder on this machine (Config.UPLOAD_FOLDER)"""
+
+    presigned_urls = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def local_path(self, key):
+        """Path on disk for a key; only the local backend has one"""
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key):
+        return os.path.getsize(self.local_path(key))
+
+    def open(self, key):
+        return open(self.local_path(key), 'rb')
+
+    def put_stream(self, key, stream, chunk_size=64 * 1024):
+        """Write a stream to a key without holding it in memory.
+
+        The key only appears once the whole stream is written, as it does
+        on S3, so an interrupted write never looks complete.
+        """
+        path = self.local_path(key)
+        partial_path = f"{path}.{uuid.uuid4().hex}.partial"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(partial_path, 'wb') as out:
+                shutil.copyfileobj(stream, out, chunk_size)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def put_file(self, key, source_path, move=True):
+        """Store a local file under key, moving it when allowed"""
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if move:
+            os.replace(source_path, path)
+            return
+        try:
+            os.link(source_path, path)
+        except OSError:
+            shutil.copyfile(source_path, path)
+
+    def move(self, source_key, key):
+        self.put_file(key, self.local_path(source_key), move=True)
+
+    def delete(self, key):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        shutil.rmtree(self.local_path(prefix), ignore_errors=True)
+
+    def download_to(self, key, path):
+        shutil.copyfile(self.local_path(key), path)
+
+    def iter_files(self, prefix='', skip_folders=(), start_after=None):
+        """Yield (key, size, mtime) for every stored file under prefix, sorted
+        by key. With start_after only later keys are listed; folders that
+        sort wholly before it are not read at all."""
+        return self._walk(self.local_path(prefix), prefix, set(skip_folders), start_after)
+
+    def _walk(self, folder, prefix, skip_folders, start_after=None):
+        try:
+            entries = list(os.scandir(folder))
+        except FileNotFoundError:
+            return
+
+        # Directories sort as 'name/' so the walk matches a plain sort of full keys
+        keyed = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not prefix and entry.name in skip_folders:
+                    continue
+                keyed.append((entry.name + '/', entry))
+            elif entry.is_file(follow_symlinks=False):
+                keyed.append((entry.name, entry))
+        keyed.sort(key=lambda item: item[0])
+
+        for name, entry in keyed:
+            key = prefix + name
+            if name.endswith('/'):
+                if start_after and start_after.startswith(key):
+                    yield from self._walk(entry.path, key, skip_folders, start_after)
+                elif not start_after or key > start_after:
+                    yield from self._walk(entry.path, key, skip_folders)
+            elif not start_after or key > start_after:
+                stat = entry.stat()
+                yield key, stat.st_size, stat.st_mtime
+
+class S3Storage:
+    """Stores files in an S3-compatible bucket (AWS S3, MinIO, Ceph, ...).
+
+    Downloads are redirected to short-lived presigned URLs, so file bytes
+    never pass through the app servers. Needs the optional boto3 package.
+    """
+
+    presigned_urls = True
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None, part_size=None):
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+            from boto3.s3.transfer import TransferConfig
+        except ImportError:
+            raise StorageError('The S3 storage backend needs boto3: pip install boto3')
+
+        if not bucket:
+            raise StorageError('S3_BUCKET must be set for the S3 storage backend')
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix else ''
+        self.part_size = part_size or Config.UPLOAD_PART_SIZE
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            # Path-style addressing works with MinIO and other stand-ins
+            config=BotoConfig(s3={'addressing_style': 'path'}, signature_version='s3v4')
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size
+        )
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def local_path(self, key):
+        return None
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def put_stream(self, key, stream):
+        """Multipart upload straight from a stream, one part in memory at a time"""
+        upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key))
+        upload_id = upload['UploadId']
+        parts = []
+        try:
+            while True:
+                data = _read_exactly(stream, self.part_size)
+                # S3 needs at least one part, even for an empty file
+                if not data and parts:
+                    break
+                part_number = len(parts) + 1
+                result = self.client.upload_part(
+                    Bucket=self.bucket,
+                    Key=self._key(key),
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=data
+                )
+                parts.append({'ETag': result['ETag'], 'PartNumber': part_number})
+                if len(data) < self.part_size:
+                    break
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self._key(key),
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+
+    def put_file(self, key, source_path, move=True):
+        # upload_file switches to a parallel multipart upload for large files
+        self.client.upload_file(source_path, self.bucket, self._key(key), Config=self.transfer_config)
+        if move:
+            os.remove(source_path)
+
+    def move(self, source_key, key):
+        # Managed copy, multipart for objects over the 5GB single-copy limit
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self._key(source_key)},
+            self.bucket,
+            self._key(key),
+            Config=self.transfer_config
+        )
+        self.delete(source_key)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_prefix(self, prefix):
+        keys = [key for key, size, mtime in self.iter_files(prefix)]
+        # delete_objects takes at most 1000 keys per call
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': self._key(key)} for key in keys[start:start + 1000]]}
+            )
+
+    def download_to(self, key, path):
+        self.client.download_file(self.bucket, self._key(key), path, Config=self.transfer_config)
+
+    def presigned_url(self, key, expires, content_type=None, content_disposition=None):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        if content_disposition:
+            params['ResponseContentDisposition'] = content_disposition
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+    def iter_files(self, prefix='', skip_folders=(), start_after=None):
+        """Yield (key, size, mtime) for every object under prefix, or only
+        those after start_after. S3 lists keys in sorted order."""
+        params = {'Bucket': self.bucket, 'Prefix': self._key(prefix)}
+        if start_after:
+            params['StartAfter'] = self._key(start_after)
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(**params):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                if key.split('/', 1)[0] in skip_folders:
+                    continue
+                yield key, item['Size'], item['LastModified'].timestamp()
+
+def _read_exactly(stream, size):
+    """Read up to size bytes, looping over short reads"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+def temp_key():
+    """Key for an upload whose content hash is not known yet"""
+    return f"tmp/{uuid.uuid4().hex}"
+
+_storage = None
+
+def get_storage():
+    """The configured storage backend, created on first use"""
+    global _storage
+    if _storage is None:
+        if Config.STORAGE_BACKEND == 's3':
+            _storage = S3Storage(
+                bucket=Config.S3_BUCKET,
+                prefix=Config.S3_PREFIX,
+                endpoint_url=Config.S3_ENDPOINT_URL,
+                region=Config.S3_REGION,
+                access_key_id=Config.S3_ACCESS_KEY_ID,
+                secret_access_key=Config.S3_SECRET_ACCESS_KEY
+            )
+        elif Config.STORAGE_BACKEND == 'local':
+            _storage = LocalStorage(Config.UPLOAD_FOLDER)
+        else:
+            raise StorageError(f'Unknown STORAGE_BACKEND: {Config.STORAGE_BACKEND}')
+    return _storage
@@ -0,0 +1,153 @@
+import csv
+import io
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from models import db, User
+import workers
+
+ROLES = {'student', 'teacher', 'admin'}
+DEFAULT_PASSWORD = 'password123'
+BATCH_SIZE = 1000
+
+def import_users(stream, dry_run=False, batch_size=BATCH_SIZE, max_rows=None, pool=None):
+    """Create users from a CSV file with a header row.
+
+    Columns: name, role, username, student_number, password (only name and
+    role are required, plus a username or student number to log in with).
+    The file is checked in batches, with one duplicate query per column
+    per batch. Then every password is hashed across a process pool (pool,
+    or the shared background pool) while no write is open. Finally all
+    rows are inserted and committed in one short transaction. Rows with
+    errors are skipped and reported. Files of more than max_rows rows are
+    refused before anything is hashed.
+
+    Returns {'rows', 'created', 'errors'}, errors being (line, message) pairs.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='') if _is_binary(stream) else stream
+    reader = csv.DictReader(text)
+    missing = {'name', 'role'} - set(reader.fieldnames or [])
+    if missing:
+        return {'rows': 0, 'created': 0, 'errors': [(1, f"Missing column(s): {', '.join(sorted(missing))}")]}
+
+    report = {'rows': 0, 'created': 0, 'errors': []}
+    # Usernames and student numbers seen earlier in this file
+    seen_usernames = set()
+    seen_student_numbers = set()
+
+    valid = []
+    batch = []
+    for row in reader:
+        report['rows'] += 1
+        batch.append((reader.line_num, row))
+        if len(batch) >= batch_size:
+            valid += _check_batch(batch, seen_usernames, seen_student_numbers, report)
+            batch = []
+    if batch:
+        valid += _check_batch(batch, seen_usernames, seen_student_numbers, report)
+    # Nothing below runs inside this read transaction
+    db.session.rollback()
+
+    if max_rows and report['rows'] > max_rows:
+        return {'rows': report['rows'], 'created': 0, 'errors': [
+            (1, f"The file has {report['rows']} rows; files of more than {max_rows} must be imported "
+                f"with `flask import-users`")
+        ]}
+
+    report['errors'].sort()
+    if dry_run or not valid:
+        report['created'] = len(valid)
+        return report
+
+    # Hashing is deliberately slow, so spread it over the pool's processes
+    hashes = (pool or workers.get_pool()).map(
+        generate_password_hash, [user.pop('password') for line, user in valid], chunksize=16
+    )
+    for (line, user), password_hash in zip(valid, hashes):
+        user['password_hash'] = password_hash
+
+    # The short write: rows taken while hashing are skipped
+    valid = _drop_taken(valid, batch_size, report)
+    try:
+        for start in range(0, len(valid), batch_size):
+            db.session.execute(insert(User), [user for line, user in valid[start:start + batch_size]])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        report['errors'].append((1, 'Another change created one of these users during the import; '
+                                    'nothing was imported, please try again'))
+        return report
+
+    report['errors'].sort()
+    report['created'] = len(valid)
+    return report
+
+def _is_binary(stream):
+    return not isinstance(stream, io.TextIOBase)
+
+def _clean(row, column):
+    return (row.get(column) or '').strip()
+
+def _check_batch(batch, seen_usernames, seen_student_numbers, report):
+    """The batch's rows that can be imported, as (line, user) pairs"""
+    rows = []
+    for line, row in batch:
+        user = {
+            'name': _clean(row, 'name'),
+            'role': _clean(row, 'role').lower(),
+            'username': _clean(row, 'username') or None,
+            'student_number': _clean(row, 'student_number') or None,
+            'password': _clean(row, 'password') or DEFAULT_PASSWORD
+        }
+        error = _validate(user, seen_usernames, seen_student_numbers)
+        if error:
+            report['errors'].append((line, error))
+            continue
+        if user['username']:
+            seen_usernames.add(user['username'])
+        if user['student_number']:
+            seen_student_numbers.add(user['student_number'])
+        rows.append((line, user))
+
+    return _without_taken(rows, report)
+
+def _without_taken(rows, report):
+    """rows minus those whose username or student number exists already,
+    with one query per column"""
+    taken_usernames = _existing(User.username, {user['username'] for line, user in rows if user['username']})
+    taken_student_numbers = _existing(User.student_number,
+                                      {user['student_number'] for line, user in rows if user['student_number']})
+
+    valid = []
+    for line, user in rows:
+        if user['username'] in taken_usernames:
+            report['errors'].append((line, f"Username {user['username']} already exists"))
+        elif user['student_number'] in taken_student_numbers:
+            report['errors'].append((line, f"Student number {user['student_number']} already exists"))
+        else:
+            valid.append((line, user))
+    return valid
+
+def _drop_taken(rows, batch_size, report):
+    valid = []
+    for start in range(0, len(rows), batch_size):
+        valid += _without_taken(rows[start:start + batch_size], report)
+    return valid
+
+def _validate(user, seen_usernames, seen_student_numbers):
+    if not user['name']:
+        return 'Name is required'
+    if user['role'] not in ROLES:
+        return f"Role must be one of: {', '.join(sorted(ROLES))}"
+    if not user['username'] and not user['student_number']:
+        return 'A username or student number is required'
+    if user['username'] in seen_usernames:
+        return f"Username {user['username']} appears more than once in the file"
+    if user['student_number'] in seen_student_numbers:
+        return f"Student number {user['student_number']} appears more than once in the file"
+    return None
+
+def _existing(column, values):
+    if not values:
+        return set()
+    return {value for (value,) in db.session.query(column).filter(column.in_(values))}
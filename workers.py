@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+_pool = None
+
+def _init_worker():
+    # Each worker opens its own storage client instead of sharing the
+    # parent's connections across the fork
+    import storage
+    storage._storage = None
+
+def after_fork():
+    """Forget the pool and storage client inherited from a parent process,
+    e.g. in a web worker forked from a preloading gunicorn master"""
+    global _pool
+    _pool = None
+    _init_worker()
+
+def get_pool():
+    """Process pool for CPU-heavy background work, created on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=Config.BACKGROUND_WORKERS,
+            initializer=_init_worker
+        )
+    return _pool
+
+def submit(fn, *args):
+    """Run fn(*args) in the background pool and return its future"""
+    global _pool
+    try:
+        return get_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool
+        _pool = None
+        return get_pool().submit(fn, *args)